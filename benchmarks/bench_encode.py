@@ -0,0 +1,107 @@
+"""
+Benchmarks encoding a full routing table into response packets for every
+neighbour, comparing RIP_Router's encoder with the original create_response
+which built each entry with int.to_bytes. Also times a steady-state periodic
+update, whose responses come from the router's response cache, and one after
+a single route has changed, which patches the cache
+
+Usage: python3 benchmarks/bench_encode.py [table sizes...]
+
+Christopher Stewart (cst141) 21069553
+Frederik Markwell (fma107) 51118501
+"""
+
+import os, sys, timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ripd import RIP_Router, Row, HEADER_FORMAT
+
+CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests", "1", "config1.txt")
+
+
+def legacy_create_response(router, destination, triggered):
+    """
+    create_response as it was before packets were encoded in bulk
+    """
+    command = int(2).to_bytes(1, 'big')
+    version = int(2).to_bytes(1, 'big')
+    router_id = int(router.instance_id).to_bytes(2, 'big')
+    zero2 = int(0).to_bytes(2, 'big')
+    header = command + version + router_id
+
+    payload = bytes()
+    for router_id in router.table.keys():
+        if not triggered or router.table[router_id].changed:
+            addr_family_id = int(2).to_bytes(2, 'big')
+            ipv4_addr = int(router_id).to_bytes(4, 'big')
+            zero4 = int(0).to_bytes(4, 'big')
+            if router.table[router_id].next_hop == destination:
+                metric = int(16).to_bytes(4, 'big')
+            else:
+                metric = int(router.table[router_id].cost).to_bytes(4, 'big')
+            payload += addr_family_id + zero2 + ipv4_addr + zero4 + zero4 + metric
+    result = header + payload
+    return bytearray(result)
+
+
+def make_router(size):
+    """
+    Creates a router whose table has size routes spread over its neighbours
+    """
+    router = RIP_Router(CONFIG, verbose=False)
+    neighbours = [id for _, _, id in router.neighbour_info]
+    for dest in range(100, 100 + size - 1):
+        router.table[dest] = Row(dest % 15 + 1, neighbours[dest % len(neighbours)])
+    return router
+
+
+def legacy_all_responses(router):
+    return [legacy_create_response(router, id, False) for _, _, id in router.neighbour_info]
+
+
+def bulk_all_responses(router):
+    """
+    Encodes the table as send_all_responses does, but as a single message
+    per neighbour so the result can be compared with the legacy encoder
+    """
+    header = HEADER_FORMAT.pack(2, 2, router.instance_id)
+    entries, poison_offsets = router.encode_response(False)
+    return [header + router.poison_response(entries, poison_offsets, id)
+        for _, _, id in router.neighbour_info]
+
+
+def cached_all_responses(router):
+    return [router.create_response(id, False) for _, _, id in router.neighbour_info]
+
+
+def patched_all_responses(router):
+    """
+    Changes the cost of one route, then gets the responses from the cache
+    """
+    dest = next(reversed(router.table))
+    row = router.table[dest]
+    router.update_row(dest, row.cost % 15 + 1, 0, row.next_hop)
+    return cached_all_responses(router)
+
+
+def main():
+    sizes = [int(x) for x in sys.argv[1:]] or [1000, 10000]
+    print("{:>8} | {:>12} | {:>12} | {:>8} | {:>12} | {:>12}".format(
+        "routes", "legacy (ms)", "bulk (ms)", "speedup", "cached (ms)", "patched (ms)"))
+    for size in sizes:
+        router = make_router(size)
+        assert legacy_all_responses(router) == bulk_all_responses(router)
+        assert cached_all_responses(router) == [router.split_messages(response[HEADER_FORMAT.size:])
+            for response in bulk_all_responses(router)]
+
+        number = max(1, 20000 // size)
+        legacy = min(timeit.repeat(lambda: legacy_all_responses(router), number=number, repeat=3)) / number
+        bulk = min(timeit.repeat(lambda: bulk_all_responses(router), number=number, repeat=3)) / number
+        cached = min(timeit.repeat(lambda: cached_all_responses(router), number=number, repeat=3)) / number
+        patched = min(timeit.repeat(lambda: patched_all_responses(router), number=number, repeat=3)) / number
+        print("{:>8} | {:>12.3f} | {:>12.3f} | {:>7.1f}x | {:>12.4f} | {:>12.4f}".format(
+            size, legacy * 1000, bulk * 1000, legacy / bulk, cached * 1000, patched * 1000))
+
+
+if __name__ == "__main__":
+    main()
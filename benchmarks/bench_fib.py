@@ -0,0 +1,97 @@
+"""
+Benchmarks longest prefix match lookups in a router's forwarding table. A
+router is given a table of random routes, each owning a random prefix, and a
+batch of random addresses is looked up with ForwardingTable.lookup_many and,
+to check the results, by trying every prefix length from /32 down in a
+dictionary of the prefixes. Also times compiling the table and patching it
+after a route changes
+
+Usage: python3 benchmarks/bench_fib.py [--routes 1000 10000] [--addresses 1000000]
+
+Christopher Stewart (cst141) 21069553
+Frederik Markwell (fma107) 51118501
+"""
+
+import argparse, os, random, sys, time, timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ripd import RIP_Router, Row
+from ripfib import ADDRESS_BITS, NO_ROUTE
+
+CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests", "1", "config1.txt")
+
+
+def make_router(size, rng):
+    """
+    Creates a router whose table has size routes spread over its neighbours,
+    one in sixteen of them unreachable, and a random prefix (of /8 to /32)
+    for each destination
+    """
+    router = RIP_Router(CONFIG, verbose=False)
+    neighbours = [id for _, _, id in router.neighbour_info]
+    prefixes = {}
+    for dest in range(100, 100 + size - 1):
+        router.table[dest] = Row(rng.randint(1, 16), rng.choice(neighbours))
+        length = rng.randint(8, ADDRESS_BITS)
+        address = rng.getrandbits(ADDRESS_BITS) >> (ADDRESS_BITS - length) << (ADDRESS_BITS - length)
+        prefixes[(address, length)] = dest
+    return router, prefixes
+
+
+def naive_lookup(router, by_length, address):
+    """
+    Finds the longest matching prefix by trying each length in turn
+    """
+    for length in range(ADDRESS_BITS, -1, -1):
+        dest = by_length.get((address >> (ADDRESS_BITS - length), length))
+        if dest is not None:
+            row = router.table.get(dest)
+            return row.next_hop if row is not None and row.cost < 16 else NO_ROUTE
+    return NO_ROUTE
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark forwarding table lookups")
+    parser.add_argument("--routes", nargs="+", type=int, default=[1000, 10000])
+    parser.add_argument("--addresses", type=int, default=1000000)
+    parser.add_argument("--seed", type=int, default=1)
+    arguments = parser.parse_args()
+    rng = random.Random(arguments.seed)
+
+    print("{:>8} | {:>12} | {:>12} | {:>14} | {:>14}".format(
+        "routes", "compile (ms)", "patch (ms)", "batch (M/s)", "naive (M/s)"))
+    for size in arguments.routes:
+        router, prefixes = make_router(size, rng)
+        addresses = [rng.getrandbits(ADDRESS_BITS) for _ in range(arguments.addresses)]
+        # Half of the addresses fall within a prefix
+        for i in range(0, len(addresses), 2):
+            address, length = rng.choice(list(prefixes))
+            addresses[i] = address | (addresses[i] & ((1 << (ADDRESS_BITS - length)) - 1))
+        by_length = {(address >> (ADDRESS_BITS - length), length): dest
+            for (address, length), dest in prefixes.items()}
+
+        compile_time = min(timeit.repeat(lambda: router.forwarding_table(prefixes), number=1, repeat=3))
+        fib = router.forwarding_table()
+
+        def patch():
+            dest = rng.randrange(100, 100 + size - 1)
+            router.table[dest].next_hop = rng.choice(list(router.neighbour_ports))
+            router.route_changed(dest)
+            fib.refresh()
+        patch_time = min(timeit.repeat(patch, number=100, repeat=3)) / 100
+
+        start = time.perf_counter()
+        next_hops = fib.lookup_many(addresses)
+        batch = time.perf_counter() - start
+        checked = addresses[:100000]
+        start = time.perf_counter()
+        expected = [naive_lookup(router, by_length, address) for address in checked]
+        naive = time.perf_counter() - start
+        assert list(next_hops[:len(checked)]) == expected
+
+        print("{:>8} | {:>12.3f} | {:>12.4f} | {:>14.2f} | {:>14.2f}".format(size, compile_time * 1000,
+            patch_time * 1000, len(addresses) / batch / 1e6, len(checked) / naive / 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+Convergence benchmarks. Generates a topology (ring, grid, random or
+scale-free, with random link costs), builds the configuration of each of its
+routers, and runs them in the discrete-event simulator until every
+router's table matches the shortest-path oracle. Reports the simulated time to
+converge, the packets and bytes sent, and the peak memory used per router,
+and appends the results to a JSON lines file so that runs of different
+versions can be compared
+
+Usage: python3 benchmarks/convergence.py --topology ring grid --routers 100 1000
+
+Christopher Stewart (cst141) 21069553
+Frederik Markwell (fma107) 51118501
+"""
+
+import argparse, json, math, os, random, subprocess, sys, time, tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ripsim import Simulator
+from riporacle import load_topology
+from parseutils import RouterConfig
+
+RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "convergence_results.jsonl")
+
+# Input port of the first router, the others are numbered on from it
+BASE_PORT = 10000
+
+
+def ring(n, rng):
+    return [(i, i % n + 1) for i in range(1, n + 1)] if n > 2 else [(1, 2)]
+
+
+def grid(n, rng):
+    """
+    Routers in rows of ceil(sqrt(n)), each linked to the router to its right
+    and the router below it
+    """
+    width = math.ceil(math.sqrt(n))
+    links = []
+    for i in range(1, n + 1):
+        if i % width != 0 and i + 1 <= n:
+            links.append((i, i + 1))
+        if i + width <= n:
+            links.append((i, i + width))
+    return links
+
+
+def random_graph(n, rng, degree=4):
+    """
+    A random spanning tree (so the network is connected) plus random extra
+    links until the average degree is reached
+    """
+    links = set()
+    for i in range(2, n + 1):
+        links.add((rng.randint(1, i - 1), i))
+    target = min(n * degree // 2, n * (n - 1) // 2)
+    while len(links) < target:
+        a, b = rng.sample(range(1, n + 1), 2)
+        links.add((min(a, b), max(a, b)))
+    return sorted(links)
+
+
+def scale_free(n, rng, m=2):
+    """
+    Barabasi-Albert preferential attachment: each new router links to m
+    existing routers, chosen with probability proportional to their degree
+    """
+    links = set()
+    endpoints = [] # each router appears once for every link it has
+    for i in range(2, min(m + 1, n) + 1):
+        for j in range(1, i):
+            links.add((j, i))
+            endpoints += [j, i]
+    for i in range(m + 2, n + 1):
+        targets = set()
+        while len(targets) < m:
+            targets.add(rng.choice(endpoints))
+        for target in targets:
+            links.add((target, i))
+            endpoints += [target, i]
+    return sorted(links)
+
+
+TOPOLOGIES = {"ring": ring, "grid": grid, "random": random_graph, "scale-free": scale_free}
+
+
+def generate(topology, n, seed, max_cost):
+    """
+    Returns the links of a generated topology as (router_a, router_b, cost)
+    """
+    rng = random.Random(seed)
+    return [(a, b, rng.randint(1, max_cost)) for a, b in TOPOLOGIES[topology](n, rng)]
+
+
+def make_configs(n, links, periodic_update_time):
+    """
+    Returns a RouterConfig for each router, giving each router one input port
+    which all of its neighbours send to. The routers are handed these
+    directly, rather than writing and parsing a configuration file for each
+    """
+    outputs = {i: [] for i in range(1, n + 1)}
+    for a, b, cost in links:
+        outputs[a].append((BASE_PORT + b, cost, b))
+        outputs[b].append((BASE_PORT + a, cost, a))
+    return [RouterConfig(i, [BASE_PORT + i], outputs[i], periodic_update_time * 6,
+        periodic_update_time, periodic_update_time * 4) for i in range(1, n + 1)]
+
+
+def converged(simulator, oracle):
+    """
+    Checks whether every router's table matches the oracle's
+    """
+    for router_id, router in simulator.routers.items():
+        if oracle.check_table(router_id, router.table):
+            return False
+    return True
+
+
+def git_version():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+            text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def benchmark(topology, n, seed, max_cost, periodic_update_time, max_time, step, measure_memory):
+    """
+    Runs one benchmark, returning a dictionary of results
+    """
+    links = generate(topology, n, seed, max_cost)
+
+    configs = make_configs(n, links, periodic_update_time)
+    oracle = load_topology(configs)
+    if measure_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    simulator = Simulator(configs, seed=seed)
+    simulator.start()
+    convergence_time = None
+    events = 0
+    while simulator.time() < max_time:
+        events += simulator.run(step)
+        if converged(simulator, oracle):
+            convergence_time = simulator.time()
+            break
+    wall_time = time.perf_counter() - start
+    peak_memory = None
+    if measure_memory:
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {
+        "version": git_version(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "topology": topology,
+        "routers": n,
+        "links": len(links),
+        "seed": seed,
+        "max_cost": max_cost,
+        "periodic_update_time": periodic_update_time,
+        "converged": convergence_time is not None,
+        "convergence_time": convergence_time,
+        "wall_time": round(wall_time, 3),
+        "events": events,
+        "packets": simulator.packets_sent,
+        "bytes": simulator.bytes_sent,
+        "peak_memory_per_router": peak_memory // n if peak_memory is not None else None,
+    }
+
+
+def previous_result(filename, result):
+    """
+    Returns the last saved result for the same benchmark, or None
+    """
+    keys = ("topology", "routers", "seed", "max_cost", "periodic_update_time")
+    previous = None
+    if os.path.exists(filename):
+        with open(filename) as results_file:
+            for line in results_file:
+                saved = json.loads(line)
+                if all(saved.get(key) == result[key] for key in keys):
+                    previous = saved
+    return previous
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how RIP routers converge on generated topologies")
+    parser.add_argument("--topology", nargs="+", choices=sorted(TOPOLOGIES), default=["ring"])
+    parser.add_argument("--routers", nargs="+", type=int, default=[100])
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--max-cost", type=int, default=3, help="link costs are between 1 and this")
+    parser.add_argument("--periodic", type=int, default=30, help="periodic update time of the routers")
+    parser.add_argument("--max-time", type=float, default=3600, help="simulated seconds to wait for convergence")
+    parser.add_argument("--step", type=float, default=1, help="simulated seconds between convergence checks")
+    parser.add_argument("--no-memory", action="store_true", help="do not trace memory (faster)")
+    parser.add_argument("--output", default=RESULTS_FILE, help="JSON lines file the results are appended to")
+    arguments = parser.parse_args()
+
+    for topology in arguments.topology:
+        for n in arguments.routers:
+            result = benchmark(topology, n, arguments.seed, arguments.max_cost, arguments.periodic,
+                arguments.max_time, arguments.step, not arguments.no_memory)
+            previous = previous_result(arguments.output, result)
+
+            print("{topology} with {routers} routers and {links} links:".format(**result))
+            if result["converged"]:
+                print("  converged after {convergence_time:.1f} simulated s ({wall_time:.2f} s wall time)".format(**result))
+            else:
+                print("  did not converge within {} simulated s".format(arguments.max_time))
+            print("  {packets} packets, {bytes} bytes, {events} events".format(**result))
+            if result["peak_memory_per_router"] is not None:
+                print("  peak memory {} bytes per router".format(result["peak_memory_per_router"]))
+            if previous:
+                print("  previous run ({}): converged after {} s, {} packets, {} s wall time".format(
+                    previous["version"], previous["convergence_time"], previous["packets"], previous["wall_time"]))
+
+            with open(arguments.output, "a") as results_file:
+                results_file.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,5 @@
 #!/usr/bin/env bash
-gnome-terminal -- python3 ripd.py tests/1/config1.txt
-gnome-terminal -- python3 ripd.py tests/1/config2.txt
-gnome-terminal -- python3 ripd.py tests/1/config3.txt
-gnome-terminal -- python3 ripd.py tests/1/config4.txt
-gnome-terminal -- python3 ripd.py tests/1/config5.txt
-gnome-terminal -- python3 ripd.py tests/1/config6.txt
-gnome-terminal -- python3 ripd.py tests/1/config7.txt
+# Starts the routers of tests/1 headlessly in pre-forked workers, and stops
+# them on Ctrl-C. To watch a router's table, run it on its own instead:
+#     python3 ripd.py tests/1/config1.txt
+python3 riplaunch.py tests/1/config*.txt "$@"
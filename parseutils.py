@@ -6,6 +6,12 @@ Frederik Markwell (fma107) 51118501
 """
 
 import sys
+from collections import namedtuple
+
+# The settings of one router, as returned by parse_config_file. The routers
+# accept one of these in place of the name of a configuration file
+RouterConfig = namedtuple("RouterConfig", ["instance_id", "input_ports", "neighbour_info",
+    "timeout", "periodic_update_time", "garbage_time"])
 
 def read_lines_from_file(filename):
     """
@@ -70,8 +76,9 @@ def is_valid_link(link, existing_ports):
 
 def parse_config_file(filename):
     """
-    Reads a file as described in the assignment description and returns a tuple
-    with instance_id, input_ports, neighbour_info, and the timeout values
+    Reads a file as described in the assignment description and returns a
+    RouterConfig with instance_id, input_ports, neighbour_info, and the timeout
+    values
     """
     lines = read_lines_from_file(filename)
 
@@ -131,4 +138,13 @@ def parse_config_file(filename):
     if not all((id_set, inputs_set, outputs_set)):
         print("Need all of router-id, input-ports, outputs")
         sys.exit()
-    return instance_id, input_ports, neighbour_info, timeout, periodic_update_time, garbage_time
+    return RouterConfig(instance_id, input_ports, neighbour_info, timeout, periodic_update_time, garbage_time)
+
+def load_config(config):
+    """
+    Returns config if it is already a RouterConfig, otherwise parses the
+    configuration file it names
+    """
+    if isinstance(config, RouterConfig):
+        return config
+    return parse_config_file(config)
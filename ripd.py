@@ -6,29 +6,77 @@ Christopher Stewart (cst141) 21069553
 Frederik Markwell (fma107) 51118501
 """
 
-import socket, os, sys, select, time, random
-from parseutils import parse_config_file
+import sys, select, time, random, heapq, itertools, struct, argparse
+from array import array
+from parseutils import load_config
+from riptransport import (MAX_PACKET_SIZE, LinkConditions, UDPTransport,
+    UnixTransport)
+from ripmetrics import (Metrics, MetricsServer, UnixMetricsServer, SamplingProfiler,
+    PACKET_SIZE_BUCKETS)
+from riptrace import TraceRecorder
+from ripsnapshot import save_snapshot, load_snapshot
+from ripfib import ForwardingTable
+
+# Maximum number of entries sent in one message (RFC 2453 allows 25). Larger
+# tables are split over several messages
+MAX_ENTRIES = 25
+
+# Layout of RIP packets, see create_response
+HEADER_FORMAT = struct.Struct('>BBH') # command, version, router_id
+REQUEST = 1
+RESPONSE = 2
+ENTRY_SIZE = 20
+METRIC_OFFSET = 16 # offset of the metric within an entry
+AF_INET = 2
+INFINITY = 16
+INFINITY_METRIC = INFINITY.to_bytes(4, 'big')
+
+# The only entry of a request for the whole table (RFC 2453 3.9.1): address
+# family 0 and metric 16
+REQUEST_ENTRY = struct.pack('>HHIIII', 0, 0, 0, 0, 0, INFINITY)
+
+# Number of periodic update intervals within which a route restored from a
+# snapshot must be confirmed by its next hop, or it times out
+REVALIDATE_UPDATES = 2
+
+# Default rate (messages per second) and burst size of the token bucket which
+# limits the triggered update messages sent to each neighbour
+TRIGGERED_RATE = 50
+TRIGGERED_BURST = 100
+
+# Default time in seconds that route changes are collected for before a
+# triggered update is sent, so a burst of changes goes out in one update
+COALESCE_WINDOW = 0.1
+
+# Changes how the router prints out its table by default. If PRETTY, redraws
+# the table in place on the screen. If not, prints the table below the
+# previous output. Either way it is only printed when it has changed
+PRETTY = True
 
-# Sets the maximum size packet that the router can receive
-MAX_PACKET_SIZE = 4096
+# Default maximum number of times per second the table is printed
+DISPLAY_RATE = 10
 
-# Changes how the router prints out its table. If PRETTY, prints as often as
-# possible, clearing the screen. If not, prints only when there is an update
-# and does not clear the screen.
-PRETTY = True
+# ANSI escape codes to move the cursor to the top left and clear the screen
+CLEAR_SCREEN = "\x1b[H\x1b[2J"
 
 class Row():
     """
     Entry in the routers forwarding table (dictionary) where the key is the
-    destination router_id. A new row is created whenever the route is updated
+    destination router_id. Rows are updated in place for as long as there is
+    a route to the destination, and have slots rather than a __dict__ to keep
+    large tables small
     """
-    def __init__(self, cost, next_hop):
+    __slots__ = ('cost', 'next_hop', 'last_response_time', 'changed', 'deadline')
+
+    def __init__(self, cost, next_hop, last_response_time=0):
         self.cost = cost
         self.next_hop = next_hop
-        self.last_response_time = time.time()
-        self.timer = 0
+        self.last_response_time = last_response_time
 
         self.changed = True # Set false when a packet is sent containing this row
+
+        # Deadline of the row's entry in RIP_Router.route_deadlines, or None
+        self.deadline = None
     def __str__(self):
         return '(cost:' + str(self.cost) + ', next_hop:' + str(self.next_hop) + ')'
     def __repr__(self):
@@ -36,115 +84,409 @@ class Row():
 
 
 
-class RIP_Router():
+class TableDisplay():
     """
-    The main router class. Calls self.run on init, which enters an infinte loop.
-    The infinite loop sends an update message every 30 s, and waits for incoming
-    messages, which it uses to update its forwarding table
+    Prints a router's table to the console whenever the table changes, but no
+    more than max_rate times a second. Changes made while the display is
+    throttled are drawn when the router next processes its timers
     """
-    # Dictionary with key=destination_router_id, value=Row object
-    table = {}
-
-    # List of sockets, each bound to one of the input_ports
-    input_sockets = None
-
-    # Local computer address
-    address = 'localhost'
-
-    # Router-id of running process
-    instance_id = None
+    def __init__(self, router, pretty=PRETTY, max_rate=DISPLAY_RATE):
+        self.router = router
+        self.pretty = pretty
+        self.interval = 1 / max_rate
+        self.drawn_version = None
+        self.next_draw = 0
+
+    def next_deadline(self):
+        """
+        Returns the time at which a throttled change will be drawn, or None
+        if the table on screen is up to date
+        """
+        if self.drawn_version == self.router.table_version:
+            return None
+        return self.next_draw
 
-    # List of info on links to neighbour routers
-    # Composed of tuples (output_port, cost, router_id)
-    neighbour_info = None
+    def refresh(self):
+        """
+        Draws the table if it has changed and the display is not throttled
+        """
+        if self.drawn_version == self.router.table_version:
+            return
+        now = self.router.clock()
+        if now < self.next_draw:
+            return
+        self.drawn_version = self.router.table_version
+        self.next_draw = now + self.interval
+        table = self.router.format_table()
+        if self.pretty:
+            print(CLEAR_SCREEN + table, flush=True)
+        else:
+            print(table)
+
+
+class TokenBucket():
+    """
+    Limits the rate of messages sent to one neighbour. Holds up to burst
+    tokens, which are refilled at rate per second, and each message sent
+    takes one. Starts full
+    """
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
 
-    # Timer to keep track of whether a triggered update has been sent recently
-    # Helps prevent network congestion
-    triggered_update_timer = 0
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = None
 
-    # If the triggered_update_timer reaches 0 and this is True, will send a triggered update
-    triggered_update_waiting = False
+    def take(self, count, now):
+        """
+        Takes up to count tokens, returning the number taken
+        """
+        if self.updated is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        taken = min(count, int(self.tokens))
+        self.tokens -= taken
+        return taken
+
+    def ready_time(self):
+        """
+        Returns the time at which there will next be a token to take
+        """
+        if self.updated is None:
+            return 0
+        return self.updated + max(0, 1 - self.tokens) / self.rate
 
 
+class RIP_Router():
+    """
+    The main router class. Construction parses the configuration file and sets
+    up the router's state; run enters an infinite loop which sends an update
+    message every 30 s, and waits for incoming messages, which it uses to
+    update its forwarding table. Several routers may share one process, as all
+    state is kept on the instance
+    """
     def close(self):
         """
-        Closes all sockets and exits the program
+        Closes the transport (and with it any sockets), and the trace after
+        recording the final table
         """
-        print("Closing")
-        if self.input_sockets:
-            for input_socket in self.input_sockets:
-                input_socket.close()
-        sys.exit()
-
-
-    def __init__(self, filename):
+        self.log("Closing")
+        self.transport.close()
+        if self.snapshot:
+            self.save_snapshot()
+        if self.trace:
+            self.trace.table(self.table)
+            self.trace.close()
+
+
+    def __init__(self, filename, verbose=True, clock=time.monotonic, rng=None,
+            max_entries=MAX_ENTRIES, display=None, transport=None, stats=None,
+            trace=None, snapshot=None, triggered_rate=TRIGGERED_RATE,
+            triggered_burst=TRIGGERED_BURST, coalesce_window=COALESCE_WINDOW,
+            stagger=False):
         """
-        Parses the provided configuration file and sets all configurable
-        variables. Creates sockets, initial forwarding table, and then
-        listens in a loop for other RIP daemons
+        Parses the provided configuration file (or takes the settings from a
+        RouterConfig passed in its place) and sets all configurable
+        variables, then creates the initial forwarding table. Sockets are not
+        created until open is called.
+            verbose         - if False, prints nothing, for hosting many
+                              routers in one process
+            display         - TableDisplay printing the table when it
+                              changes, by default one if verbose. False to
+                              run headless
+            clock, rng      - the current time in seconds, and a
+                              random.Random for the jitter on update timers.
+                              Replaced to run in simulated time
+            max_entries     - routes in each message, which must fit in
+                              MAX_PACKET_SIZE
+            transport       - carries packets (see riptransport), by default
+                              a UDPTransport
+            stats           - ripmetrics.Metrics to count and time in, by
+                              default nothing is recorded
+            trace           - riptrace.TraceRecorder, for ripreplay
+            snapshot        - file the table is saved to and started from,
+                              see restore_snapshot
+            triggered_rate  - triggered update messages a second allowed to
+                              each neighbour (see TokenBucket), None or 0
+                              for no limit
+            triggered_burst - triggered update messages which may be sent to
+                              a neighbour at once
+            coalesce_window - see COALESCE_WINDOW
+            stagger         - send periodic updates to one neighbour at a
+                              time, see send_staggered_update
         """
         (self.instance_id,
-        input_ports,
+        self.input_ports,
         self.neighbour_info,
         self.timeout,
         self.periodic_update_time,
-        self.garbage_time) = parse_config_file(filename)
+        self.garbage_time) = load_config(filename)
 
         self.garbage_time += self.timeout
 
-        self.init_input_ports(input_ports)
+        # Router ids of the neighbours, key=the output port we send to them on
+        self.port_neighbours = {port: id for port, _, id in self.neighbour_info}
+        # and the reverse, key=router id, value=output port
+        self.neighbour_ports = {id: port for port, _, id in self.neighbour_info}
+
+        if max_entries < 1 or HEADER_FORMAT.size + ENTRY_SIZE * max_entries > MAX_PACKET_SIZE:
+            raise ValueError("{} entries per message do not fit in {} bytes".format(max_entries, MAX_PACKET_SIZE))
+        self.max_entries = max_entries
+
+        if triggered_rate is not None and triggered_rate < 0:
+            raise ValueError("triggered update rate {} is negative".format(triggered_rate))
+        if triggered_rate and triggered_burst < 1:
+            raise ValueError("triggered update burst {} is less than one message".format(triggered_burst))
+
+        # Counts of the messages and bytes sent by the router, and of the
+        # messages sent to all neighbours by the last update
+        self.packets_sent = 0
+        self.bytes_sent = 0
+        self.last_update_packets = 0
+
+        self.verbose = verbose
+
+        self.stats = stats
+        if stats:
+            self.register_stats()
+
+        # Incremented whenever the table changes, so the display knows when to redraw
+        self.table_version = 0
+        if display is None and verbose:
+            display = TableDisplay(self)
+        self.display = display or None
+        self.clock = clock
+        self.random = rng if rng is not None else random.Random()
+        self.trace = trace
+        if trace:
+            self.clock = trace.clock(self.clock)
+            self.random = trace.random(self.random)
+
+        # Dictionary with key=destination_router_id, value=Row object
+        self.table = {}
+
+        # Sends to the output ports of neighbours and receives on input_ports
+        # (tuples of (output_port, cost, router_id) are kept in neighbour_info)
+        self.transport = transport if transport is not None else UDPTransport()
+        self.opened = False
+
+        # Time at which the next periodic update is due, set by start_updates
+        self.next_periodic_update = None
+
+        # Time until which no triggered update may be sent, because one has
+        # been sent recently. Helps prevent network congestion
+        self.triggered_update_hold_until = 0
+
+        # If the hold down time has passed and this is True, will send a triggered update
+        self.triggered_update_waiting = False
+
+        # Time at which the coalescing window of the waiting triggered update
+        # ends. The update is sent after both this and the hold down time
+        self.coalesce_window = coalesce_window
+        self.triggered_update_after = 0
+
+        # Token bucket limiting the triggered update messages sent to each
+        # neighbour, key=router id. Empty if triggered updates are unlimited
+        self.triggered_buckets = {}
+        if triggered_rate:
+            self.triggered_buckets = {id: TokenBucket(triggered_rate, triggered_burst)
+                for _, _, id in self.neighbour_info}
+
+        # Destinations whose triggered update to a neighbour was held back by
+        # the neighbour's token bucket, key=router id, value=set of destinations.
+        # They are sent (with their current routes) as the bucket refills
+        self.deferred_routes = {}
+
+        # If stagger, periodic updates go to one neighbour at a time, and this
+        # is the index in neighbour_info of the next to get one
+        self.stagger = stagger
+        self.periodic_position = 0
+
+        # Min-heap of (deadline, sequence_number, destination, Row) giving the
+        # next time each route may time out or be deleted. Entries are not
+        # removed when a route is refreshed or replaced, instead they are
+        # checked against the table and the row's deadline when they reach
+        # the top of the heap
+        self.route_deadlines = []
+        self.deadline_sequence = itertools.count()
+
+        # Destinations of the routes with changed set, which are the ones sent
+        # in the next triggered update. Kept so that triggered updates do not
+        # need to look through the whole table
+        self.changed_routes = set()
+
+        # Messages of the last full response encoded for each neighbour,
+        # key=router id, value=list of messages, which are reused for periodic
+        # updates while the table is unchanged. response_cache_index gives the
+        # position of each destination's entry in the messages, and
+        # stale_routes the destinations whose routes have changed since they
+        # were encoded, which refresh_response_cache patches in place
+        self.response_cache = {}
+        self.response_cache_index = {}
+        self.response_cache_version = None
+        self.stale_routes = set()
+
+        # Forwarding table compiled from the table, created by forwarding_table
+        self.fib = None
+
+        #init table with own entry (which never expires, so has no deadline)
+        self.table[self.instance_id] = Row(0,self.instance_id,self.clock())
+        self.changed_routes.add(self.instance_id)
+
+        self.snapshot = snapshot
+        if snapshot:
+            self.restore_snapshot()
+
+
+    def save_snapshot(self):
+        """
+        Saves the table to the snapshot file. A failure to write it is
+        printed rather than stopping the router
+        """
+        try:
+            save_snapshot(self.snapshot, self.instance_id, self.table, self.clock())
+        except OSError as e:
+            self.log("Could not save snapshot [{}]".format(e))
 
-        #init table with own entry
-        self.table[self.instance_id] = Row(0,self.instance_id)
+    def restore_snapshot(self):
+        """
+        Adds the routes saved in the snapshot file to the table, so that a
+        restarted router does not have to wait for its neighbours' updates
+        (nor send triggered updates as routes arrive). Routes are restored
+        with the time they had left before timing out, less the time the
+        router was down; routes which have since expired, are unreachable or
+        go through a router which is no longer a neighbour are left out.
+        Restored routes must be confirmed by their next hop within
+        REVALIDATE_UPDATES periodic updates or they time out, so a route
+        which was lost while the router was down is not kept for long.
+        Restored routes are not marked as changed. Returns the number of
+        routes restored
+        """
+        try:
+            router_id, saved_at, routes = load_snapshot(self.snapshot)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            self.log("Could not restore snapshot [{}]".format(e))
+            return 0
+        if router_id != self.instance_id:
+            self.log("Snapshot {} is of router {}, not restoring it".format(self.snapshot, router_id))
+            return 0
+
+        now = self.clock()
+        down_time = max(0, time.time() - saved_at)
+        revalidate = self.periodic_update_time * REVALIDATE_UPDATES
+        neighbour_ids = set(self.port_neighbours.values())
+        restored = []
+        for dest, cost, next_hop, age in routes:
+            remaining = self.timeout - age - down_time
+            if cost >= 16 or remaining <= 0 or next_hop not in neighbour_ids or dest in self.table:
+                continue
+            restored.append((dest, cost, next_hop, now - self.timeout + min(remaining, revalidate)))
+        self.restore_routes(restored)
+        if self.trace:
+            self.trace.restored(restored)
+        self.log("Restored {} routes from {}".format(len(restored), self.snapshot))
+        return len(restored)
+
+    def restore_routes(self, routes):
+        """
+        Adds restored routes, a list of (destination, cost, next_hop,
+        last_response_time), to the table without marking them as changed.
+        Also used by ripreplay to restore the routes recorded in a trace
+        """
+        for dest, cost, next_hop, last_response_time in routes:
+            row = Row(cost, next_hop, last_response_time)
+            row.changed = False
+            self.table[dest] = row
+            self.route_changed(dest)
+            self.push_route_deadline(dest, row)
+        if routes:
+            self.table_version += 1
 
-        self.print_table()
 
-        self.run()
-        self.close()
+    def log(self, *args):
+        """
+        Prints a message to the console, unless the router is not verbose
+        """
+        if self.verbose:
+            print(*args)
 
 
-    def init_input_ports(self, input_ports):
+    def register_stats(self):
         """
-        Creates a socket for each input port provided in the configuration file
-        and binds them to localhost
+        Describes the router's metrics and adds its gauges
         """
-        self.input_sockets = []
-        for rx_port in input_ports:
-            try:
-                rx_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, 0)
-                rx_socket.bind((self.address, rx_port))
-                self.input_sockets.append(rx_socket)
-            except Exception as e:
-                print("failed to create socket.", rx_port, e)
-                self.close()
+        self.stats.describe("packets_total", "RIP messages sent and received, by neighbour")
+        self.stats.describe("bytes_total", "Bytes of RIP messages sent and received, by neighbour")
+        self.stats.describe("packet_bytes", "Sizes of RIP messages sent and received")
+        self.stats.describe("invalid_packets_total", "Messages rejected by read_response, by reason")
+        self.stats.describe("read_response_seconds", "Time taken to check and decode a message")
+        self.stats.describe("update_table_seconds", "Time taken to update the table from a message")
+        self.stats.describe("create_response_seconds", "Time taken to encode an update or an answer to a request")
+        self.stats.describe("route_changes_total", "Routes added, changed, timed out and deleted")
+        self.stats.describe("updates_total", "Periodic and triggered updates sent to all neighbours")
+        self.stats.describe("requests_total", "Requests for the whole table sent and answered")
+        self.stats.describe("deferred_messages_total", "Triggered update messages held back by a token bucket")
+        self.stats.describe("response_cache_total", "Full responses reused, patched or rebuilt from the cache")
+        self.stats.describe("routes", "Routes in the table, including unreachable ones")
+        self.stats.gauge("routes", lambda: len(self.table))
+        self.stats.gauge("table_version", lambda: self.table_version)
+
+
+    def open(self):
+        """
+        Opens the transport on all input ports and prints the initial table
+        """
+        self.transport.open(self)
+        self.opened = True
+        self.refresh_display()
 
     def print_table(self):
         """
         Prints the forwarding table to the console
         """
-        print("\n" + "-" * 30)
-        print("Forwarding Table for {}".format(self.instance_id))
+        print(self.format_table())
+
+    def format_table(self):
+        """
+        Returns the forwarding table formatted for printing
+        """
+        lines = ["\n" + "-" * 30]
+        lines.append("Forwarding Table for {}".format(self.instance_id))
         headings = ["Address", "Next Hop", "Cost", "Timer", "Change"]
-        print((" | ").join(headings))
-        print("-" * sum(len(heading) + 3 for heading in headings))
+        lines.append((" | ").join(headings))
+        lines.append("-" * sum(len(heading) + 3 for heading in headings))
+        now = self.clock()
         for dest, row in sorted(self.table.items(), key=lambda x: x[0]):
-            timer = ""
-            if dest in self.table.keys():
-                timer = f"{self.table[dest].timer:.2f}"
+            timer = 0
+            if dest != self.instance_id:
+                timer = now - row.last_response_time
+            timer = f"{timer:.2f}"
 
-            print("{} | {} | {} | {} | {}".format(
+            lines.append("{} | {} | {} | {} | {}".format(
                 str(dest).center(len(headings[0])),
                 str(row.next_hop).center(len(headings[1])),
                 str(row.cost).center(len(headings[2])),
                 str(timer).center(len(headings[3])),
                 str(row.changed).center(len(headings[4]))
             ))
+        return "\n".join(lines)
+
+    def refresh_display(self):
+        """
+        Redraws the table if it has changed since it was last drawn (and the
+        router is not headless)
+        """
+        if self.display:
+            self.display.refresh()
 
 
     def create_response(self, destination, triggered):
         """
-        Creates a RIP response packet for the destination router in
-        the below format
+        Creates the RIP response messages for the destination router, each
+        holding up to max_entries routes, in the below format
 
         command(1) - version(1) - router_id(2)  #header(4)
 
@@ -154,99 +496,324 @@ class RIP_Router():
         zero(4)
         metric(4)
         """
-        command = int(2).to_bytes(1, 'big')
-        version = int(2).to_bytes(1, 'big')
-        router_id = int(self.instance_id).to_bytes(2, 'big')
-        zero2 = int(0).to_bytes(2, 'big')
-        header = command + version + router_id # header uses router_id instead of 16bit zero
+        if not triggered and destination in self.neighbour_ports:
+            return self.cached_response(destination)
+        entries, poison_offsets = self.encode_response(triggered)
+        return self.split_messages(self.poison_response(entries, poison_offsets, destination))
 
-        payload = bytes()
-        for router_id in self.table.keys(): # for each destination router_id
-            if not triggered or self.table[router_id].changed:
-                # Only send all routes if not triggered update
+    def cached_response(self, neighbour_id):
+        """
+        Returns the messages of a full response to a neighbour from the
+        response cache, refreshing the cache first if the table has changed.
+        The messages are shared with later updates, so must not be modified
+        """
+        self.refresh_response_cache()
+        return self.response_cache[neighbour_id]
 
-                addr_family_id = int(2).to_bytes(2, 'big') # 2 = AF_INET
-                ipv4_addr = int(router_id).to_bytes(4, 'big') # next_hop is the router sending the response packet
-                zero4 = int(0).to_bytes(4, 'big')
+    def refresh_response_cache(self):
+        """
+        Brings the cached responses up to date with the table. If only the
+        costs or next hops of routes have changed, just their metrics are
+        rewritten in each neighbour's messages; if routes have been added or
+        deleted, the responses are encoded again
+        """
+        if self.response_cache_version == self.table_version:
+            kind = "reused"
+        elif self.response_cache_version is not None and all(
+                dest in self.response_cache_index and dest in self.table for dest in self.stale_routes):
+            kind = "patched"
+            for dest in self.stale_routes:
+                row = self.table[dest]
+                message, entry = divmod(self.response_cache_index[dest], self.max_entries)
+                offset = HEADER_FORMAT.size + ENTRY_SIZE * entry + METRIC_OFFSET
+                metric = row.cost.to_bytes(4, 'big')
+                for id, messages in self.response_cache.items():
+                    messages[message][offset:offset + 4] = INFINITY_METRIC if row.next_hop == id else metric
+        else:
+            kind = "rebuilt"
+            dests = list(self.table)
+            entries, poison_offsets = self.encode_routes(dests)
+            self.response_cache = {id: [bytearray(message) for message in
+                self.split_messages(self.poison_response(entries, poison_offsets, id))]
+                for _, _, id in self.neighbour_info}
+            self.response_cache_index = {dest: i for i, dest in enumerate(dests)}
+        self.stale_routes.clear()
+        self.response_cache_version = self.table_version
+        if self.stats:
+            self.stats.count("response_cache_total", kind=kind)
+
+    def encode_response(self, triggered):
+        """
+        Encodes the routes to send (all of them, or just the changed ones if
+        triggered), see encode_routes
+        """
+        if triggered:
+            # Only send all routes if not triggered update
+            return self.encode_routes(sorted(self.changed_routes))
+        return self.encode_routes(list(self.table))
 
+    def encode_routes(self, dests):
+        """
+        Encodes the routes to a list of destinations into response entries in
+        one pass, without split horizon. Each entry is five 32 bit words, so
+        the entries are built a column at a time in an array of words.
+        Returns the entries and a dictionary mapping each next hop to the
+        offsets of the metrics of routes through it, which poison_response
+        uses to poison the entries for one neighbour
+        """
+        rows = [self.table[dest] for dest in dests]
+
+        words = array('I', bytes(ENTRY_SIZE * len(dests)))
+        words[0::5] = array('I', [AF_INET << 16]) * len(dests) # addr_family_id and zero
+        words[1::5] = array('I', dests) # ipv4_addr is the destination router_id
+        words[4::5] = array('I', [row.cost for row in rows]) # metric
+        if sys.byteorder == 'little':
+            words.byteswap()
+
+        poison_offsets = {}
+        offset = METRIC_OFFSET
+        for row in rows:
+            poison_offsets.setdefault(row.next_hop, []).append(offset)
+            offset += ENTRY_SIZE
+        return words.tobytes(), poison_offsets
+
+    def poison_response(self, entries, poison_offsets, destination):
+        """
+        Returns a copy of the entries from encode_response with the metric of
+        every route that goes through the destination router set to 16
+        (split horizon with poisoned reverse)
+        """
+        entries = bytearray(entries)
+        for offset in poison_offsets.get(destination, ()):
+            entries[offset:offset + 4] = INFINITY_METRIC
+        return entries
 
-                if self.table[router_id].next_hop == destination:
-                    # Route goes through the router we are sending to, should poison
-                    metric = int(16).to_bytes(4, 'big')
-                else:
-                    # No need to poison
-                    metric = int(self.table[router_id].cost).to_bytes(4, 'big')
-                payload += addr_family_id + zero2 + ipv4_addr + zero4 + zero4 + metric
-        result = header + payload
-        return bytearray(result)
+    def split_messages(self, entries):
+        """
+        Splits encoded entries into messages of at most max_entries entries,
+        each with its own header. Returns an empty list if there are no entries
+        """
+        # header uses router_id instead of 16bit zero
+        header = HEADER_FORMAT.pack(RESPONSE, 2, self.instance_id)
+        size = ENTRY_SIZE * self.max_entries
+        return [header + entries[i:i + size] for i in range(0, len(entries), size)]
 
     def send_response(self, addr_id, addr_port, triggered):
         """
         Creates and sends a response / triggered update to a specific router
         """
-        packet = self.create_response(addr_id, triggered)
-        target = (self.address, addr_port)
-        self.input_sockets[0].sendto(bytes(packet),target)
+        start = time.perf_counter()
+        packets = self.create_response(addr_id, triggered)
+        if self.stats:
+            self.stats.observe("create_response_seconds", time.perf_counter() - start)
+        for packet in packets:
+            self.send_message(packet, addr_port)
+
+    def send_message(self, packet, addr_port):
+        """
+        Sends one message of a response, counting it towards the packets sent
+        """
+        self.packets_sent += 1
+        self.bytes_sent += len(packet)
+        if self.stats:
+            neighbour = self.port_neighbours.get(addr_port)
+            self.stats.count("packets_total", direction="out", neighbour=neighbour)
+            self.stats.count("bytes_total", len(packet), direction="out", neighbour=neighbour)
+            self.stats.observe("packet_bytes", len(packet), PACKET_SIZE_BUCKETS, direction="out")
+        self.send_packet(bytes(packet), addr_port)
+
+    def send_packet(self, packet, addr_port):
+        """
+        Sends a packet to the router listening on addr_port
+        """
+        if self.trace:
+            self.trace.sent(packet, addr_port)
+        self.transport.send(packet, addr_port)
+
+    def send_requests(self):
+        """
+        Asks every neighbour for its whole table, which it sends back at once
+        rather than at its next periodic update
+        """
+        packet = HEADER_FORMAT.pack(REQUEST, 2, self.instance_id) + REQUEST_ENTRY
+        for output_port in self.neighbour_ports.values():
+            self.send_message(packet, output_port)
+        if self.stats:
+            self.stats.count("requests_total", len(self.neighbour_ports), direction="out")
 
     def send_all_responses(self, triggered=False):
         """
-        Iterates all neighbour ports, and sends a response / triggered update to each
+        Iterates all neighbour ports, and sends a response / triggered update
+        to each. Triggered updates are limited by each neighbour's token
+        bucket, and routes held back from a neighbour earlier are added to
+        its triggered update. A periodic update replaces any routes held back
         """
 
         # If we send a normal message, we don't need to send a triggered update later
         self.triggered_update_waiting = False
 
-        for output_port, cost, id in self.neighbour_info:
-            self.send_response(id, output_port, triggered)
+        # The routes are encoded once, then poisoned separately for each
+        # neighbour. Full responses come from the response cache
+        packets_sent = self.packets_sent
+        start = time.perf_counter()
+        if triggered:
+            dests = sorted(self.changed_routes)
+            entries, poison_offsets = self.encode_routes(dests)
+            responses = []
+            deferred = []
+            for output_port, cost, id in self.neighbour_info:
+                if id in self.deferred_routes:
+                    # Encoded separately, along with the routes held back
+                    deferred.append((id, self.deferred_routes.pop(id).union(dests)))
+                    continue
+                responses.append((id, output_port,
+                    self.split_messages(self.poison_response(entries, poison_offsets, id))))
+        else:
+            self.refresh_response_cache()
+            responses = [(id, output_port, self.response_cache[id])
+                for output_port, cost, id in self.neighbour_info]
+        if self.stats:
+            self.stats.observe("create_response_seconds", time.perf_counter() - start)
+            self.stats.count("updates_total", kind="triggered" if triggered else "periodic")
+        if triggered:
+            for id, held_back in deferred:
+                self.send_deferred_routes(id, held_back)
+            for id, output_port, packets in responses:
+                self.send_limited(id, output_port, dests, packets)
+        else:
+            self.deferred_routes.clear()
+            for id, output_port, packets in responses:
+                for packet in packets:
+                    self.send_message(packet, output_port)
+        self.last_update_packets = self.packets_sent - packets_sent
+
+        self.clear_changed_routes()
+
+    def clear_changed_routes(self):
+        """
+        Routes are no longer considered "new" once we have sent them out
+        """
+        if self.changed_routes:
+            self.table_version += 1
+        for dest in self.changed_routes:
+            self.table[dest].changed = False
+        self.changed_routes.clear()
 
-        # Routes are no longer considered "new" once we have sent them out
-        for row in self.table.values():
-            row.changed = False
+    def send_limited(self, neighbour_id, output_port, dests, packets):
+        """
+        Sends the messages of a triggered update to one neighbour, as many as
+        its token bucket allows. The destinations of the messages which are
+        not sent are held back, to be sent when the bucket refills. dests are
+        the destinations of the entries in packets, in order
+        """
+        bucket = self.triggered_buckets.get(neighbour_id)
+        allowed = len(packets) if bucket is None else bucket.take(len(packets), self.clock())
+        for packet in packets[:allowed]:
+            self.send_message(packet, output_port)
+        if allowed < len(packets):
+            self.deferred_routes[neighbour_id] = set(dests[allowed * self.max_entries:])
+            if self.stats:
+                self.stats.count("deferred_messages_total", len(packets) - allowed)
+
+    def send_deferred_routes(self, neighbour_id, dests):
+        """
+        Sends a triggered update of the current routes to some destinations
+        (those still in the table) to one neighbour, limited by its bucket
+        """
+        start = time.perf_counter()
+        dests = sorted(dest for dest in dests if dest in self.table)
+        entries, poison_offsets = self.encode_routes(dests)
+        packets = self.split_messages(self.poison_response(entries, poison_offsets, neighbour_id))
+        if self.stats:
+            self.stats.observe("create_response_seconds", time.perf_counter() - start)
+        self.send_limited(neighbour_id, self.neighbour_ports[neighbour_id], dests, packets)
+
+    def send_staggered_update(self, now):
+        """
+        Sends the periodic update to the next neighbour in turn, and schedules
+        the one after so that each neighbour gets an update every
+        periodic_update_time on average, but not all at the same time.
+        Returns True when every neighbour has had one (the end of a round),
+        after which the routes sent are no longer marked as changed
+        """
+        output_port, _, id = self.neighbour_info[self.periodic_position]
+        self.send_response(id, output_port, False)
+        self.deferred_routes.pop(id, None)
+        if self.stats:
+            self.stats.count("updates_total", kind="staggered")
+        self.periodic_position = (self.periodic_position + 1) % len(self.neighbour_info)
+        self.next_periodic_update = now + self.next_periodic_interval() / len(self.neighbour_info)
+        if self.periodic_position != 0:
+            return False
+        self.clear_changed_routes()
+        return True
 
     def read_response(self,data):
         """
-        Converts the received packet to a table if it follows the correct format
-        returns (packet_valid(bool), router_id(int), table(dict))
+        Checks that a received packet follows the correct format, and decodes
+        its entries without creating an object for each of them.
+        returns (packet_valid(bool), router_id(int), destinations, metrics)
+        where destinations and metrics are arrays with one value per entry
         """
-        command = data[0]
-        version = data[1]
-        if command != 2 or version !=2:
-            print("invalid command/version",command,version)
-            return False, 0, 0 # command or version value is incorrect
+        if len(data) < HEADER_FORMAT.size:
+            return self.reject("length", "invalid packet length", len(data))
 
-        router_id = int.from_bytes(data[2:4], 'big') # router(id) that sent the data
+        # router_id is the router that sent the data
+        command, version, router_id = HEADER_FORMAT.unpack_from(data)
+        if command != RESPONSE or version !=2:
+            # command or version value is incorrect
+            return self.reject("command", "invalid command/version", command, version)
 
-        i = 4 # packet payload (RIP entries) starts after 4 bytes
         if (len(data)-4) % 20 != 0 or len(data) <= 4:
-            print("invalid packet length", len(data))
-            return False,0,0 # data length incorrect (should be 4 + 20x) where x > 0
-
-        recvd_table = {}
-        while i < len(data):
-            try:
-                zeros = []#append all expected zero values here to validate packet
-                addr_family_id = int.from_bytes(data[i:i+2], 'big')
-                i+=2
-                zeros.append(int.from_bytes(data[i:i+2], 'big'))#zero2
-                i+=2
-                ipv4_addr = int.from_bytes(data[i:i+4], 'big')#dest addr from the router sending
-                i+=4
-                zeros.append(int.from_bytes(data[i:i+4], 'big'))#zero4
-                i+=4
-                zeros.append(int.from_bytes(data[i:i+4], 'big'))#zero4
-                i+=4
-                metric = int.from_bytes(data[i:i+4], 'big')# between 1-15 (inclusive) or 16 (inf)
-                row = Row(metric, router_id)#cost, next_hop
-                recvd_table[ipv4_addr] = row
-                i+=4
-
-                if min(zeros) != 0 or max(zeros) != 0 or metric < 0 or metric > 16:
-                    print("invalid RIP ENTRY format", zeros,metric)
-                    return False,0,0#bad RIP entry
-            except IndexError:
-                print("index error", i, len(data))
-                return False,0,0#data length incorrect (should be 4 + 20x)
-        return True, router_id, recvd_table
+            # data length incorrect (should be 4 + 20x) where x > 0
+            return self.reject("length", "invalid packet length", len(data))
+
+        # Each entry is five big endian 32 bit words:
+        # addr_family_id(2) - zero(2), ipv4_addr, zero, zero, metric
+        words = array('I')
+        words.frombytes(memoryview(data)[HEADER_FORMAT.size:])
+        if sys.byteorder == 'little':
+            words.byteswap()
+        destinations = words[1::5]
+        metrics = words[4::5] # between 1-15 (inclusive) or 16 (inf)
+
+        # Validate every entry at once. The zero after addr_family_id is
+        # checked on the bytes, the zero words on the decoded array
+        zero2 = bytes(data[6::20]) + bytes(data[7::20])
+        if zero2.count(0) != len(zero2) or any(words[2::5]) or any(words[3::5]):
+            return self.reject("padding", "invalid RIP ENTRY format, non-zero padding") # bad RIP entry
+        if max(metrics) > 16:
+            return self.reject("metric", "invalid RIP ENTRY format, metric", max(metrics)) # bad RIP entry
+
+        return True, router_id, destinations, metrics
+
+    def read_request(self, data):
+        """
+        Checks that a received request is for the whole table (a single entry
+        with address family 0 and metric 16) and comes from a neighbour.
+        Requests for particular routes are not supported.
+        returns (packet_valid(bool), router_id(int), (), ()) like read_response
+        """
+        if len(data) != HEADER_FORMAT.size + ENTRY_SIZE:
+            return self.reject("length", "invalid request length", len(data))
+        command, version, router_id = HEADER_FORMAT.unpack_from(data)
+        if version != 2:
+            return self.reject("command", "invalid command/version", command, version)
+        if bytes(data[HEADER_FORMAT.size:]) != REQUEST_ENTRY:
+            return self.reject("request", "request is not for the whole table")
+        if router_id not in self.neighbour_ports:
+            return self.reject("neighbour", "request from", router_id, "which is not a neighbour")
+        return True, router_id, (), ()
+
+    def reject(self, reason, *message):
+        """
+        Logs why a packet is invalid and counts it by reason. Returns the
+        result of read_response for an invalid packet
+        """
+        self.log(*message)
+        if self.stats:
+            self.stats.count("invalid_packets_total", reason=reason)
+        return False, 0, (), ()
 
     def cost_to_neighbour(self, router_id):
         """
@@ -256,9 +823,10 @@ class RIP_Router():
         cost = self.neighbour_info[neighbour_ids.index(router_id)][1]
         return cost
 
-    def update_table(self, other_router_id, other_table):
+    def update_table(self, other_router_id, destinations, metrics):
         """
-        Compares tables with a received table and updates if
+        Compares tables with the routes (destinations and their metrics)
+        received from another router and updates if
             1. A route is better than the current route
                 or
             2. The route comes from the router from which the the old route
@@ -268,73 +836,293 @@ class RIP_Router():
         (so that route may timeout)
         """
         cost = self.cost_to_neighbour(other_router_id)
-        for dest in other_table.keys():
-            other_row = other_table[dest]
-
-            try:
-                current_row = self.table[dest]
-                from_authority = self.table[dest].next_hop == other_router_id
-                cost_changed = current_row.cost != min(16, other_row.cost + cost)
-
-                if from_authority:
-                    # Our current route comes from this router, so must take their value
-                    if cost_changed:
-                        # Change our table to match the authority
-                        self.update_row(dest, cost, other_row, other_router_id)
-                        if cost + other_row.cost >= 16:
-                            self.triggered_update_waiting = True
-                    elif current_row.cost != 16:
-                        # Resets the timer for reachable routes (to keep it alive)
-                        self.table[dest].last_response_time = time.time()
-                        self.table[dest].timer = 0.00
-                elif current_row.cost > (other_row.cost + cost):
-                    # The current route is less optimal than the jump to the neighbour + the neighbours route
-                    self.update_row(dest, cost, other_row, other_router_id)
-
-            except KeyError: # We currently do not have a route to this dest
-                if other_table[dest].cost + cost < 16: # Ignore routes with cost > 16
-                    self.update_row(dest, cost, other_row, other_router_id)
-
-        self.print_table()
-
-    def update_row(self, dest, cost, other_row, other_router_id):
+        now = self.clock()
+        for dest, metric in zip(destinations, metrics):
+            current_row = self.table.get(dest)
+
+            if current_row is None: # We currently do not have a route to this dest
+                if metric + cost < 16: # Ignore routes with cost > 16
+                    self.update_row(dest, cost, metric, other_router_id)
+
+            elif current_row.next_hop == other_router_id:
+                # Our current route comes from this router (the authority),
+                # so must take their value
+                if current_row.cost != min(16, metric + cost):
+                    # Change our table to match the authority
+                    self.update_row(dest, cost, metric, other_router_id)
+                    if cost + metric >= 16:
+                        self.trigger_update(now)
+                elif current_row.cost != 16:
+                    # Resets the timer for reachable routes (to keep it alive)
+                    # Its entry in route_deadlines is moved back when reached
+                    current_row.last_response_time = now
+
+            elif current_row.cost > (metric + cost):
+                # The current route is less optimal than the jump to the neighbour + the neighbours route
+                self.update_row(dest, cost, metric, other_router_id)
+
+    def update_row(self, dest, cost, metric, other_router_id):
+        """
+        Replaces an existing route with the route through another router, which
+        reported the given metric, and resets the timer on that route. The
+        existing row is reused if there is one
         """
-        Replaces an existing route with a route from a row in another table and
-        resets the timer on that route
+        row = self.table.get(dest)
+        if self.stats:
+            self.stats.count("route_changes_total", kind="new" if row is None else "updated")
+        if row is None:
+            row = Row(min(16, metric + cost), other_router_id, self.clock())
+            self.table[dest] = row
+        else:
+            row.cost = min(16, metric + cost)
+            row.next_hop = other_router_id
+            row.last_response_time = self.clock()
+            row.changed = True
+        self.table_version += 1
+        self.changed_routes.add(dest)
+        self.route_changed(dest)
+        self.push_route_deadline(dest, row)
+
+    def route_changed(self, dest):
         """
+        Records that the route to a destination has been added, changed or
+        deleted, so that the cached responses and the forwarding table are
+        patched for it
+        """
+        self.stale_routes.add(dest)
+        if self.fib:
+            self.fib.stale_routes.add(dest)
 
-        row = Row(min(16, other_row.cost + cost), other_router_id)
-        self.table[dest] = row
+    def forwarding_table(self, prefixes=None):
+        """
+        Returns the router's forwarding table (see ripfib), creating it the
+        first time. prefixes maps (address, length) to the destination router
+        whose route each prefix follows; by default each destination has the
+        /32 prefix of its router id. Giving prefixes replaces the table
+        """
+        if self.fib is None or prefixes is not None:
+            self.fib = ForwardingTable(self, prefixes)
+        return self.fib
 
-        self.table[dest].last_response_time = time.time()
-        self.table[dest].timer = 0.00
+    def route_deadline(self, row):
+        """
+        Returns the time at which a route should next be checked: when it will
+        time out if it is reachable, or when it will be deleted if not
+        """
+        if row.cost == 16:
+            return row.last_response_time + self.garbage_time
+        return row.last_response_time + self.timeout
 
+    def push_route_deadline(self, dest, row):
+        """
+        Adds an entry for a route to route_deadlines, unless the route already
+        has an entry which is due no later (that entry is pushed back with the
+        new deadline when it is reached). Each row has at most one valid entry
+        """
+        deadline = self.route_deadline(row)
+        if row.deadline is not None and row.deadline <= deadline:
+            return
+        row.deadline = deadline
+        heapq.heappush(self.route_deadlines, (deadline, next(self.deadline_sequence), dest, row))
 
     def update_table_timers(self):
         """
-        Add time waited to each routes timer, if necessary timeout or delete the route
+        Times out or deletes the routes whose deadlines have passed. Only the
+        routes at the top of the deadline heap are looked at; an entry for a
+        route that has since been refreshed is pushed back with its new deadline
+        """
+        now = self.clock()
+        while self.route_deadlines and self.route_deadlines[0][0] <= now:
+            deadline, _, dest, row = heapq.heappop(self.route_deadlines)
+            if self.table.get(dest) is not row or row.deadline != deadline:
+                continue # route has been deleted, or given an earlier entry, since the entry was pushed
+            row.deadline = None
+
+            # Compared with the same sums as route_deadline, so a route is
+            # always timed out or deleted when its deadline is reached
+            if now >= row.last_response_time + self.garbage_time:#route deleted
+                del self.table[dest]
+                self.table_version += 1
+                self.changed_routes.discard(dest)
+                self.route_changed(dest)
+                if self.stats:
+                    self.stats.count("route_changes_total", kind="deleted")
+                continue
+            if now >= row.last_response_time + self.timeout and row.cost != 16:#route timed out
+                row.cost = 16
+                row.changed = True
+                self.table_version += 1
+                self.changed_routes.add(dest)
+                self.route_changed(dest)
+                self.trigger_update(now)
+                if self.stats:
+                    self.stats.count("route_changes_total", kind="timeout")
+            self.push_route_deadline(dest, row)
+
+
+    def trigger_update(self, now):
+        """
+        Marks a triggered update as waiting. It is sent at the end of the
+        coalescing window which starts with the first change, so that changes
+        made in the meantime go in the same update
+        """
+        if not self.triggered_update_waiting:
+            self.triggered_update_waiting = True
+            self.triggered_update_after = now + self.coalesce_window
+
+    def next_periodic_interval(self):
+        """
+        Returns the time until the next periodic update, randomised by up to
+        20% either way so that routers do not synchronise their updates
         """
-        routes_to_del = []
-        for key in self.table.keys():
-            if key != self.instance_id:#don't increase timer of own route
-                self.table[key].timer = time.time() - self.table[key].last_response_time#update routes timer
-                if self.table[key].timer > self.timeout and self.table[key].cost != 16:#route timed out
-                    self.table[key].cost = 16
-                    self.table[key].changed = True
-                    self.triggered_update_waiting = True
-                    self.print_table()
-                if self.table[key].timer > self.garbage_time:#route deleted
-                    routes_to_del.append(key)
+        random_range = self.periodic_update_time * 0.4
+        return self.periodic_update_time + (self.random.random()*random_range) - random_range / 2
 
-        # We delete all the routes together so that we don't alter the indicies while looping through
-        for route in routes_to_del:
-            del self.table[route]#removes entry from table
+    def send_triggered_update(self):
+        """
+        Sends a triggered update to all neighbours and holds down further
+        triggered updates for 1-5 seconds
+        """
+        self.send_all_responses(triggered=True)
+        self.triggered_update_waiting = False
+        self.triggered_update_hold_until = self.clock() + 1 + self.random.random() * 4
+        self.log("Sent a triggered update!")
 
-        if len(routes_to_del) > 0:#if a route is deleted due to garbage collection, print updated table
-            self.print_table()
+    def start_updates(self):
+        """
+        Sends the first response to all neighbours, asks them for their
+        tables and schedules the next periodic update
+        """
+        if self.trace:
+            self.trace.started()
+        self.send_all_responses()
+        self.send_requests()
+        interval = self.next_periodic_interval()
+        if self.stagger:
+            interval /= len(self.neighbour_info)
+        self.next_periodic_update = self.clock() + interval
 
+    def next_deadline(self):
+        """
+        Returns the earliest time at which process_timers has something to do:
+        the next periodic update, the end of the triggered update hold down
+        and coalescing window (if an update is waiting), the time a token
+        bucket refills for routes held back from a neighbour, the next route
+        deadline, the time a throttled change to the table can be displayed,
+        or the time a packet delayed by the transport is due to be sent
+        """
+        deadline = self.next_periodic_update
+        if self.triggered_update_waiting:
+            deadline = min(deadline, max(self.triggered_update_hold_until, self.triggered_update_after))
+        for id in self.deferred_routes:
+            deadline = min(deadline, self.triggered_buckets[id].ready_time())
+        if self.route_deadlines:
+            deadline = min(deadline, self.route_deadlines[0][0])
+        if self.display and self.display.next_deadline() is not None:
+            deadline = min(deadline, self.display.next_deadline())
+        if self.transport.next_deadline() is not None:
+            deadline = min(deadline, self.transport.next_deadline())
+        return deadline
+
+    def process_timers(self):
+        """
+        Sends any updates (and delayed packets) which are due, including
+        routes held back by a token bucket which has refilled, and times out
+        or deletes expired routes. If tracing, the table is recorded after
+        each periodic update (or round of staggered updates)
+        """
+        if self.trace:
+            self.trace.timers()
+        self.transport.process_delayed()
+        now = self.clock()
+        periodic = now >= self.next_periodic_update
+        if periodic:
+            if self.stagger:
+                periodic = self.send_staggered_update(now)
+            else:
+                self.next_periodic_update = now + self.next_periodic_interval()
+                self.send_all_responses()
+
+        self.update_table_timers()
+
+        if (self.triggered_update_waiting and now >= self.triggered_update_hold_until
+                and now >= self.triggered_update_after):
+            self.send_triggered_update()
+
+        for id in [id for id in self.deferred_routes if self.triggered_buckets[id].ready_time() <= now]:
+            self.send_deferred_routes(id, self.deferred_routes.pop(id))
+
+        if periodic and self.trace:
+            self.trace.table(self.table)
+        if periodic and self.snapshot:
+            self.save_snapshot()
+        self.refresh_display()
+
+    def handle_packet(self, data):
+        """
+        Reads a packet received from a neighbour and, if it is valid, updates
+        the forwarding table with it. data may be a memoryview of a buffer
+        which is reused once this returns. The display is not refreshed, so
+        that a batch of packets causes only one redraw
+        """
+        if self.trace:
+            self.trace.received(data)
+        if len(data) > 0 and data[0] == REQUEST:
+            self.handle_request(data)
+            return
+        start = time.perf_counter()
+        packet_valid, other_router_id, destinations, metrics = self.read_response(data)
+        read = time.perf_counter()
+        self.count_received(data, packet_valid, other_router_id, read - start)
+        self.log("Received packet from", other_router_id)
+        if packet_valid:
+            self.update_table(other_router_id, destinations, metrics)
+            if self.stats:
+                self.stats.observe("update_table_seconds", time.perf_counter() - read)
+        else:
+            self.log("invalid packet")
+
+    def count_received(self, data, packet_valid, other_router_id, read_time=None):
+        """
+        Counts a received packet (and the time taken to read it, if given) in
+        the router's metrics. Does nothing if there are none
+        """
+        if not self.stats:
+            return
+        if read_time is not None:
+            self.stats.observe("read_response_seconds", read_time)
+        neighbour = other_router_id if packet_valid else "unknown"
+        self.stats.count("packets_total", direction="in", neighbour=neighbour)
+        self.stats.count("bytes_total", len(data), direction="in", neighbour=neighbour)
+        self.stats.observe("packet_bytes", len(data), PACKET_SIZE_BUCKETS, direction="in")
 
 
+    def handle_request(self, data):
+        """
+        Answers a neighbour's request for the whole table with a response
+        sent to that neighbour alone, which does not count as an update
+        """
+        packet_valid, other_router_id, _, _ = self.read_request(data)
+        self.log("Received request from", other_router_id)
+        self.count_received(data, packet_valid, other_router_id)
+        if packet_valid and self.stats:
+            self.stats.count("requests_total", direction="in")
+        if packet_valid:
+            self.send_response(other_router_id, self.neighbour_ports[other_router_id], False)
+        else:
+            self.log("invalid packet")
+
+
+    def receive_all(self, input_socket):
+        """
+        Reads and handles every packet waiting on one of the transport's
+        sockets. Returns the number of packets read
+        """
+        count = 0
+        for data in self.transport.receive_all(input_socket):
+            self.handle_packet(data)
+            count += 1
+        return count
 
     def run(self):
         """
@@ -343,76 +1131,123 @@ class RIP_Router():
             a routing packet received from a peer
             a timer event
         """
+        if not self.opened:
+            self.open()
 
-        inputs = [x.fileno() for x in self.input_sockets]
+        # Keep the sockets (rather than recreating them from their file
+        # descriptors) so each readable socket can be drained in one go
+        sockets = {}
+        for input_socket in self.transport.sockets():
+            sockets[input_socket.fileno()] = input_socket
+        inputs = list(sockets)
 
-        self.send_all_responses()
-
-        random_range = self.periodic_update_time * 0.4
-
-        response_timer = self.periodic_update_time
+        self.start_updates()
 
         while True:
             try:
+                # Sleep until a packet arrives or the next timer is due
+                timeout = max(0, self.next_deadline() - self.clock())
 
-                start = time.time()
-
-                rlist, wlist, xlist = select.select(inputs, [], [], 0.1 if PRETTY else 0.01)
-
-
-                if response_timer <= 0:
-                    response_timer = self.periodic_update_time + (random.random()*random_range) - random_range / 2
-                    self.send_all_responses()
-                    self.print_table()
-
-
-                self.update_table_timers()
-
-
-                if self.triggered_update_timer == 0 and self.triggered_update_waiting:
-                    self.send_all_responses(triggered=True)
-                    self.triggered_update_waiting = False
-                    self.triggered_update_timer = 1 + random.random() * 4
-                    print("Sent a triggered update!")
+                rlist, wlist, xlist = select.select(inputs, [], [], timeout)
 
 
                 '''reads responses (if any) from neighbours and updates tables'''
                 for socket_id in rlist:
-                    sock = socket.fromfd(socket_id,socket.AF_INET, socket.SOCK_DGRAM)
-                    data = sock.recv(MAX_PACKET_SIZE)
-                    packet_valid, other_router_id, other_table = self.read_response(data)
-                    print("Received packet from", other_router_id)
-                    if packet_valid:
-                        self.update_table(other_router_id, other_table)
-                    else:
-                        print("invalid packet")
-
+                    self.receive_all(sockets[socket_id])
 
-                end = time.time()
-                delta_time = end - start
 
-                response_timer = max(0, response_timer - delta_time)
-                self.triggered_update_timer = max(0, self.triggered_update_timer - delta_time)
-
-                if PRETTY:
-                    os.system("clear")
-                    self.print_table()
+                self.process_timers()
 
 
             except Exception as e:
                 print("An unexpected error occurred [{}]".format(e))
-                self.close()
-        self.close()
+                return
 
 
 def main():
-    arguments = sys.argv[1:]
-    if len(arguments) != 1:
-        print("Invalid arguments given, must include the directory of a valid configuration file")
-        sys.exit()
-    filename = arguments[0]
-    router = RIP_Router(filename)
-
-
-
-main()
+    parser = argparse.ArgumentParser(description="Run a RIP routing daemon")
+    parser.add_argument("config", help="the router's configuration file")
+    parser.add_argument("--display", choices=["pretty", "log", "none"],
+        default="pretty" if PRETTY else "log",
+        help="redraw the table in place, print it below previous output, or run headless")
+    parser.add_argument("--max-rate", type=float, default=DISPLAY_RATE,
+        help="maximum number of times per second the table is printed")
+    parser.add_argument("--transport", choices=["udp", "unix"], default="udp",
+        help="send packets over UDP or Unix datagram sockets")
+    parser.add_argument("--latency", type=float, default=0,
+        help="delay in seconds added to every packet sent")
+    parser.add_argument("--loss", type=float, default=0,
+        help="probability of dropping each packet sent")
+    parser.add_argument("--metrics-port", type=int,
+        help="serve metrics over HTTP on this localhost port")
+    parser.add_argument("--metrics-socket",
+        help="serve metrics over HTTP on a Unix socket at this path")
+    parser.add_argument("--profile", action="store_true",
+        help="sample the router's stack, served at /profile with the metrics")
+    parser.add_argument("--trace", metavar="FILE",
+        help="record the router's packets, timers and random numbers for ripreplay")
+    parser.add_argument("--triggered-rate", type=float, default=TRIGGERED_RATE,
+        help="triggered update messages per second allowed to each neighbour (0 for no limit)")
+    parser.add_argument("--triggered-burst", type=int, default=TRIGGERED_BURST,
+        help="triggered update messages which may be sent to a neighbour at once")
+    parser.add_argument("--coalesce", type=float, default=COALESCE_WINDOW,
+        help="seconds to collect route changes for before sending a triggered update")
+    parser.add_argument("--stagger", action="store_true",
+        help="spread periodic updates to different neighbours over the update interval")
+    parser.add_argument("--snapshot", metavar="FILE",
+        help="save the table to FILE after every periodic update, and start from it if it exists")
+    arguments = parser.parse_args()
+    if arguments.max_rate <= 0:
+        parser.error("--max-rate must be greater than 0")
+    if arguments.triggered_rate < 0:
+        parser.error("--triggered-rate must not be negative")
+    if arguments.triggered_burst < 1:
+        parser.error("--triggered-burst must be at least 1")
+
+    conditions = None
+    if arguments.latency or arguments.loss:
+        conditions = LinkConditions(arguments.latency, arguments.loss)
+    if arguments.transport == "unix":
+        transport = UnixTransport(conditions)
+    else:
+        transport = UDPTransport(conditions)
+
+    stats = None
+    servers = []
+    profiler = SamplingProfiler() if arguments.profile else None
+    if arguments.metrics_port or arguments.metrics_socket:
+        stats = Metrics()
+        if arguments.metrics_port:
+            servers.append(MetricsServer(stats, ('localhost', arguments.metrics_port), profiler))
+        if arguments.metrics_socket:
+            servers.append(UnixMetricsServer(stats, arguments.metrics_socket, profiler))
+
+    # Options which change what the router sends, recorded in the trace
+    options = {"triggered_rate": arguments.triggered_rate, "triggered_burst": arguments.triggered_burst,
+        "coalesce_window": arguments.coalesce, "stagger": arguments.stagger}
+    trace = TraceRecorder(arguments.trace, arguments.config, options) if arguments.trace else None
+
+    router = RIP_Router(arguments.config, verbose=arguments.display != "none",
+        display=False, transport=transport, stats=stats, trace=trace,
+        snapshot=arguments.snapshot, **options)
+    if arguments.display != "none":
+        router.display = TableDisplay(router, arguments.display == "pretty", arguments.max_rate)
+    router.open()
+    for server in servers:
+        server.start()
+    if profiler:
+        profiler.start()
+    try:
+        router.run()
+    finally:
+        # Also reached on Ctrl-C, so the end of the trace is written
+        if profiler:
+            profiler.stop()
+        for server in servers:
+            server.close()
+        router.close()
+    sys.exit()
+
+
+if __name__ == "__main__":
+    main()
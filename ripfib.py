@@ -0,0 +1,178 @@
+"""
+Forwarding information base (FIB) compiled from a router's routing table, so
+that the routes can forward simulated traffic rather than just be displayed.
+Answers "which next hop and output port for this destination address?" by
+longest prefix match.
+
+Each prefix belongs to a destination router, and forwards along the route to
+that router. By default every destination in the table owns the /32 prefix of
+its router id (the address RIP sends for it), but any prefixes may be given,
+such as the networks attached to each router. The prefixes are compiled into
+a sorted array of the starts of disjoint address ranges, each of which takes
+the next hop of its longest matching prefix, so a lookup is one bisect. When
+routes change only the next hops of their ranges are rewritten; the ranges are
+compiled again only when the prefixes change
+
+Christopher Stewart (cst141) 21069553
+Frederik Markwell (fma107) 51118501
+"""
+
+from array import array
+from bisect import bisect_right
+from itertools import repeat
+
+ADDRESS_BITS = 32
+
+# Next hop of addresses which match no prefix, or whose route is unreachable.
+# Router ids start at 1
+NO_ROUTE = 0
+
+
+def check_prefix(address, length):
+    """
+    Raises ValueError unless address/length is a prefix with no host bits set
+    """
+    if not 0 <= length <= ADDRESS_BITS:
+        raise ValueError("prefix length {} is not between 0 and {}".format(length, ADDRESS_BITS))
+    if not 0 <= address < 1 << ADDRESS_BITS or address & ((1 << (ADDRESS_BITS - length)) - 1):
+        raise ValueError("{:#010x}/{} is not a prefix".format(address, length))
+
+
+def compile_ranges(prefixes):
+    """
+    Turns prefixes (a dictionary of (address, length): destination) into
+    disjoint ranges, returning a list of the start of each range and a list of
+    the destination of its longest matching prefix (None where none match).
+    The first range starts at 0. Prefixes are either nested or disjoint, so
+    they are swept in order of address with a stack of the prefixes that are
+    open, shorter (containing) prefixes first
+    """
+    starts = [0]
+    dests = [None]
+
+    def start_range(start, dest):
+        if start >= 1 << ADDRESS_BITS:
+            return
+        if starts[-1] == start:
+            dests[-1] = dest
+        elif dests[-1] != dest:
+            starts.append(start)
+            dests.append(dest)
+
+    open_prefixes = [] # stack of (end, destination)
+    for (address, length), dest in sorted(prefixes.items()):
+        while open_prefixes and open_prefixes[-1][0] <= address:
+            end, _ = open_prefixes.pop()
+            start_range(end, open_prefixes[-1][1] if open_prefixes else None)
+        start_range(address, dest)
+        open_prefixes.append((address + (1 << (ADDRESS_BITS - length)), dest))
+    while open_prefixes:
+        end, _ = open_prefixes.pop()
+        start_range(end, open_prefixes[-1][1] if open_prefixes else None)
+    return starts, dests
+
+
+class ForwardingTable():
+    """
+    The FIB of one router, created with RIP_Router.forwarding_table. The
+    router tells it which routes have changed (through route_changed), and
+    it brings itself up to date before each lookup
+    """
+    def __init__(self, router, prefixes=None):
+        """
+        prefixes is a dictionary of (address, length): destination router id;
+        if None, each destination in the table gets the /32 prefix of its
+        router id, and prefixes follow routes as they are added and deleted
+        """
+        self.router = router
+        self.host_routes = prefixes is None
+        self.prefixes = {}
+        if prefixes is not None:
+            for (address, length), dest in prefixes.items():
+                check_prefix(address, length)
+                self.prefixes[(address, length)] = dest
+
+        # Start address of each range, and the next hop of each range shifted
+        # up one place, so next_hops[bisect_right(starts, address)] is the next
+        # hop for an address. range_indices gives the positions in next_hops
+        # of the ranges of each destination
+        self.starts = []
+        self.next_hops = array('I')
+        self.range_indices = {}
+
+        # Destinations whose routes have changed since the last lookup
+        self.stale_routes = set()
+        self.compile()
+
+    def compile(self):
+        """
+        Compiles the prefixes into ranges and looks up the next hop of each
+        """
+        if self.host_routes:
+            self.prefixes = {(dest, ADDRESS_BITS): dest for dest in self.router.table}
+        self.starts, dests = compile_ranges(self.prefixes)
+        self.range_indices = {}
+        for i, dest in enumerate(dests):
+            if dest is not None:
+                self.range_indices.setdefault(dest, []).append(i + 1)
+        self.next_hops = array('I', [NO_ROUTE] + [self.route_next_hop(dest) for dest in dests])
+        self.stale_routes.clear()
+
+    def route_next_hop(self, dest):
+        """
+        Returns the next hop of the route to a destination, or NO_ROUTE if
+        there is no reachable route to it
+        """
+        row = self.router.table.get(dest)
+        if row is None or row.cost >= 16:
+            return NO_ROUTE
+        return row.next_hop
+
+    def refresh(self):
+        """
+        Rewrites the next hops of the ranges of changed routes. With host
+        routes, a route being added or deleted changes the prefixes, so they
+        are compiled again
+        """
+        if not self.stale_routes:
+            return
+        if self.host_routes and any((dest in self.router.table) != ((dest, ADDRESS_BITS) in self.prefixes)
+                for dest in self.stale_routes):
+            self.compile()
+            return
+        for dest in self.stale_routes:
+            next_hop = self.route_next_hop(dest)
+            for i in self.range_indices.get(dest, ()):
+                self.next_hops[i] = next_hop
+        self.stale_routes.clear()
+
+    def lookup(self, address):
+        """
+        Returns (next_hop, output_port) for a destination address, or None if
+        there is no route to it. Addresses routed to this router itself have
+        its own id as the next hop and output port 0
+        """
+        self.refresh()
+        next_hop = self.next_hops[bisect_right(self.starts, address)]
+        if next_hop == NO_ROUTE:
+            return None
+        return next_hop, self.router.neighbour_ports.get(next_hop, 0)
+
+    def lookup_many(self, addresses):
+        """
+        Returns an array of the next hop of each of a sequence of addresses,
+        with NO_ROUTE for those there is no route to
+        """
+        self.refresh()
+        return array('I', map(self.next_hops.__getitem__,
+            map(bisect_right, repeat(self.starts), addresses)))
+
+    def ports_many(self, addresses):
+        """
+        Returns an array of the output port to send each of a sequence of
+        addresses on, with 0 for those there is no route to or which are for
+        this router
+        """
+        self.refresh()
+        ports = array('I', [self.router.neighbour_ports.get(next_hop, 0) for next_hop in self.next_hops])
+        return array('I', map(ports.__getitem__, map(bisect_right, repeat(self.starts), addresses)))
@@ -0,0 +1,161 @@
+"""
+Hosts many RIP routers in a single process. Every router is driven by one
+shared asyncio event loop, using a reader callback for each socket of its
+transport and timer callbacks in place of the select loop in RIP_Router.run.
+With the memory transport, packets are handed between the routers on the
+loop without any sockets
+
+Christopher Stewart (cst141) 21069553
+Frederik Markwell (fma107) 51118501
+"""
+
+import asyncio, argparse
+from ripd import RIP_Router
+from riptopology import load_network
+from riptransport import (LinkConditions, UDPTransport, UnixTransport,
+    MemoryNetwork, MemoryTransport)
+
+
+class HostedRouter(RIP_Router):
+    """
+    A router which is driven by callbacks on an asyncio event loop rather than
+    its own run loop. Nothing is printed unless verbose is set
+    """
+    def __init__(self, filename, verbose=False, **kwargs):
+        super().__init__(filename, verbose, **kwargs)
+        self.loop = None
+
+        # The single callback which wakes the router at its next deadline
+        self.wakeup_handle = None
+        self.wakeup_deadline = None
+
+    async def start(self):
+        """
+        Opens the transport and watches its sockets on the running loop, then
+        starts the router's timers
+        """
+        self.loop = asyncio.get_running_loop()
+        self.open()
+        for rx_socket in self.transport.sockets():
+            self.loop.add_reader(rx_socket, self.receive_ready, rx_socket)
+        self.start_timers()
+
+    def start_timers(self):
+        """
+        Sends the first response to all neighbours and schedules a wakeup on
+        self.loop for the router's first deadline
+        """
+        self.start_updates()
+        self.schedule_wakeup()
+
+    def receive(self, data):
+        """
+        Handles a packet arriving at one of the input ports. Any triggered
+        update it causes is sent once its hold down and coalescing window end
+        """
+        self.handle_packet(data)
+        self.process_timers()
+        self.schedule_wakeup()
+
+    def receive_ready(self, rx_socket):
+        """
+        Handles every packet waiting on a readable socket, then any updates
+        they cause
+        """
+        self.receive_all(rx_socket)
+        self.process_timers()
+        self.schedule_wakeup()
+
+    def schedule_wakeup(self):
+        """
+        Makes sure a wakeup is scheduled no later than the router's next deadline
+        """
+        deadline = self.next_deadline()
+        if self.wakeup_handle:
+            if self.wakeup_deadline <= deadline:
+                return
+            self.wakeup_handle.cancel()
+        self.wakeup_deadline = deadline
+        self.wakeup_handle = self.loop.call_later(max(0, deadline - self.clock()), self.wakeup)
+
+    def wakeup(self):
+        self.wakeup_handle = None
+        self.process_timers()
+        self.schedule_wakeup()
+
+    def close(self):
+        """
+        Cancels the wakeup, stops watching the sockets and closes the transport
+        """
+        if self.wakeup_handle:
+            self.wakeup_handle.cancel()
+            self.wakeup_handle = None
+        for rx_socket in self.transport.sockets():
+            self.loop.remove_reader(rx_socket)
+        super().close()
+
+
+class RouterHost():
+    """
+    A collection of routers sharing one event loop. transport is "udp",
+    "unix" or "memory", and conditions (a LinkConditions) is applied to the
+    packets sent by every router
+    """
+    def __init__(self, filenames, verbose=False, transport="udp", conditions=None):
+        self.network = MemoryNetwork() if transport == "memory" else None
+        self.routers = []
+        for filename in filenames:
+            if transport == "memory":
+                router_transport = MemoryTransport(self.network, conditions)
+            elif transport == "unix":
+                router_transport = UnixTransport(conditions)
+            else:
+                router_transport = UDPTransport(conditions)
+            self.routers.append(HostedRouter(filename, verbose, transport=router_transport))
+
+    async def run(self):
+        """
+        Starts every router, then serves them until cancelled
+        """
+        if self.network:
+            self.network.scheduler = asyncio.get_running_loop()
+        try:
+            for router in self.routers:
+                await router.start()
+            print("Hosting {} routers".format(len(self.routers)))
+            await asyncio.Event().wait()
+        finally:
+            self.close()
+
+    def close(self):
+        for router in self.routers:
+            router.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Host many RIP routers in one process")
+    parser.add_argument("configs", nargs="*",
+        help="configuration file of each router, or directories of configuration files")
+    parser.add_argument("--topology", metavar="FILE", help="read the whole network from a topology file")
+    parser.add_argument("--transport", choices=["udp", "unix", "memory"], default="udp",
+        help="carry packets over UDP, Unix datagram sockets, or in memory")
+    parser.add_argument("--latency", type=float, default=0,
+        help="delay in seconds added to every packet sent")
+    parser.add_argument("--loss", type=float, default=0,
+        help="probability of dropping each packet sent")
+    arguments = parser.parse_args()
+    configs = load_network(arguments.configs, arguments.topology)
+
+    conditions = None
+    if arguments.latency or arguments.loss:
+        conditions = LinkConditions(arguments.latency, arguments.loss)
+    host = RouterHost(configs, verbose=len(configs) == 1,
+        transport=arguments.transport, conditions=conditions)
+    try:
+        asyncio.run(host.run())
+    except KeyboardInterrupt:
+        print("Closing")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Starts many RIP routers at once without a desktop session, in place of
+example.sh opening a terminal running ripd.py for each router. The launcher
+imports the router code and reads every configuration once, then forks
+worker processes which inherit both (zygote style), so no worker pays for
+starting Python, importing or parsing. Each worker hosts its share of the
+routers on one asyncio event loop, as riphost does, and reports each router
+as soon as its sockets are bound. The launcher waits until every router has
+reported, prints how long they took to start, then keeps them running until
+interrupted
+
+Usage: python3 riplaunch.py --topology network.txt [--processes 8 | --per-router]
+
+Christopher Stewart (cst141) 21069553
+Frederik Markwell (fma107) 51118501
+"""
+
+import argparse, asyncio, gc, math, os, select, signal, struct, time
+from parseutils import load_config
+from riphost import RouterHost
+from riptopology import load_network
+
+# Seconds to wait for every router to bind its sockets
+START_TIMEOUT = 60
+
+# Record a worker writes to the launcher's pipe when a router has started:
+# router id, worker pid and seconds since launch (NaN if it could not start).
+# Records are smaller than PIPE_BUF, so those written by different workers
+# are never interleaved
+READY_RECORD = struct.Struct('<HId')
+
+
+async def serve(host, ready_fd, launched):
+    """
+    Starts the routers of one worker, writing a READY_RECORD for each to
+    ready_fd once its sockets are bound, or if it could not start. Then
+    serves them until the worker is terminated
+    """
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    try:
+        for router in host.routers:
+            try:
+                await router.start()
+            except (OSError, SystemExit):
+                # The transport prints why and exits if it cannot bind a port
+                print("Router {} could not start".format(router.instance_id))
+                os.write(ready_fd, READY_RECORD.pack(router.instance_id, os.getpid(), math.nan))
+                continue
+            os.write(ready_fd, READY_RECORD.pack(router.instance_id, os.getpid(), time.monotonic() - launched))
+        await asyncio.Event().wait()
+    finally:
+        host.close()
+
+
+def run_worker(configs, transport, ready_fd, launched):
+    """
+    Body of a worker process: hosts some routers until terminated, then
+    exits without returning to the launcher's code
+    """
+    status = 0
+    try:
+        signal.signal(signal.SIGINT, signal.SIG_IGN) # the launcher stops the workers
+        host = RouterHost(configs, transport=transport)
+        asyncio.run(serve(host, ready_fd, launched))
+    except asyncio.CancelledError:
+        pass
+    except BaseException as e:
+        print("Worker {} failed [{}]".format(os.getpid(), e))
+        status = 1
+    os._exit(status)
+
+
+def launch(configs, processes, transport="udp", timeout=START_TIMEOUT):
+    """
+    Forks processes workers (one for each router if processes is None) and
+    divides the routers between them. Returns (worker pids, reports, elapsed)
+    once every router has reported or timeout seconds have passed, where
+    reports maps each router id to (pid, seconds to start, or None if it did
+    not start) and elapsed is the time taken to start them all. Workers are
+    forked with os.fork rather than multiprocessing, which looks through all
+    of its children each time it starts one
+    """
+    if processes is None:
+        groups = [[config] for config in configs]
+    else:
+        processes = max(1, min(processes, len(configs)))
+        groups = [configs[i::processes] for i in range(processes)]
+
+    # Objects created so far are shared with every worker, so are moved out
+    # of the garbage collector's reach rather than copied as it touches them
+    gc.freeze()
+    read_fd, write_fd = os.pipe()
+    launched = time.monotonic()
+    workers = []
+    for group in groups:
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            run_worker(group, transport, write_fd, launched)
+        workers.append(pid)
+    os.close(write_fd)
+
+    reports = {}
+    received = 0
+    pending = b""
+    deadline = launched + timeout
+    with os.fdopen(read_fd, "rb", buffering=0) as ready:
+        while received < len(configs):
+            readable, _, _ = select.select([ready], [], [], max(0, deadline - time.monotonic()))
+            data = ready.read(READY_RECORD.size * 256) if readable else b""
+            if not data:
+                break # timed out, or every worker has exited
+            pending += data
+            whole = len(pending) - len(pending) % READY_RECORD.size
+            for router_id, pid, seconds in READY_RECORD.iter_unpack(pending[:whole]):
+                reports[router_id] = (pid, None if math.isnan(seconds) else seconds)
+                received += 1
+            pending = pending[whole:]
+    return workers, reports, time.monotonic() - launched
+
+
+def stop(workers):
+    """
+    Terminates the workers, which close their routers, and waits for them
+    """
+    for pid in workers:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    for pid in workers:
+        os.waitpid(pid, 0)
+
+
+def print_report(configs, reports, elapsed, report_file=None):
+    """
+    Prints how long the routers took to start, and the routers which did not.
+    If report_file is given, writes the time taken by each router to it
+    """
+    started = sorted(seconds for _, seconds in reports.values() if seconds is not None)
+    missing = sorted(config.instance_id for config in configs
+        if reports.get(config.instance_id, (None, None))[1] is None)
+    if started:
+        def percentile(p):
+            return started[min(len(started) - 1, int(p * len(started)))] * 1000
+        print("Started {} of {} routers in {:.2f} s (per router: median {:.1f} ms, "
+            "99th percentile {:.1f} ms, slowest {:.1f} ms)".format(len(started), len(configs), elapsed,
+            percentile(0.5), percentile(0.99), started[-1] * 1000))
+    if missing:
+        print("Not started: {}".format(", ".join(str(router_id) for router_id in missing)))
+    if report_file:
+        with open(report_file, "w") as output:
+            output.write("router_id,pid,seconds\n")
+            for router_id, (pid, seconds) in sorted(reports.items()):
+                output.write("{},{},{}\n".format(router_id, pid, "" if seconds is None else "{:.6f}".format(seconds)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Start many RIP routers headlessly in pre-forked workers")
+    parser.add_argument("configs", nargs="*",
+        help="configuration file of each router, or directories of configuration files")
+    parser.add_argument("--topology", metavar="FILE", help="read the whole network from a topology file")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(),
+        help="number of worker processes the routers are divided between")
+    parser.add_argument("--per-router", action="store_true", help="fork a worker process for every router")
+    parser.add_argument("--transport", choices=["udp", "unix"], default="udp",
+        help="carry packets over UDP or Unix datagram sockets")
+    parser.add_argument("--timeout", type=float, default=START_TIMEOUT,
+        help="seconds to wait for every router to bind its sockets")
+    parser.add_argument("--report", metavar="FILE", help="write the time each router took to start to FILE (CSV)")
+    parser.add_argument("--exit", action="store_true", help="stop the routers once they have all started")
+    arguments = parser.parse_args()
+    configs = [load_config(config) for config in load_network(arguments.configs, arguments.topology)]
+
+    # Stopping the launcher with SIGTERM stops the routers as Ctrl-C does
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    workers, reports, elapsed = launch(configs, None if arguments.per_router else arguments.processes,
+        arguments.transport, arguments.timeout)
+    try:
+        print_report(configs, reports, elapsed, arguments.report)
+        if not arguments.exit:
+            print("Running {} routers in {} processes, press Ctrl-C to stop".format(len(reports), len(workers)))
+            signal.pause()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("Closing")
+        stop(workers)
+
+
+if __name__ == "__main__":
+    main()
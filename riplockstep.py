@@ -0,0 +1,207 @@
+"""
+Lockstep simulation of distance vector rounds for capacity planning. The
+whole network is held as NumPy matrices of costs and next hops (one row per
+router), and in each round every router sends its table to every neighbour
+at once. Receiving is a vectorised min-plus update which follows the same
+rules as RIP_Router.update_table, with split horizon and poisoned reverse as
+in create_response, so convergence and counting to infinity can be studied
+over many rounds without sending any packets.
+
+There are no timers: a route whose neighbour no longer advertises it is
+treated as if the neighbour had advertised it as unreachable, which stands in
+for the route timing out
+
+Requires NumPy
+
+Christopher Stewart (cst141) 21069553
+Frederik Markwell (fma107) 51118501
+"""
+
+import argparse, sys, time
+import numpy as np
+from ripd import INFINITY
+from riporacle import read_links
+from riptopology import load_network
+
+
+class LockstepNetwork():
+    """
+    The routing tables of every router in a network. costs[i, d] is router
+    i's cost to destination d, and next_hops[i, d] the index of the router it
+    goes through (-1 if i has no route), where routers are indexed in order
+    of router_id
+    """
+    def __init__(self, links):
+        """
+        Creates the network from a list of (router_id, neighbour_id, cost),
+        with every router knowing only the route to itself
+        """
+        self.router_ids = sorted({a for a, _, _ in links} | {b for _, b, _ in links})
+        self.index = {router_id: i for i, router_id in enumerate(self.router_ids)}
+        n = len(self.router_ids)
+
+        # Neighbours of each router in the order it handles their messages,
+        # as a list of (neighbour index, cost) for each router index
+        self.neighbours = [[] for _ in range(n)]
+        for a, b, cost in links:
+            self.neighbours[self.index[a]].append((self.index[b], cost))
+        self.build_slots()
+
+        hop_type = np.int16 if n < 2 ** 15 else np.int32
+        self.costs = np.full((n, n), INFINITY, dtype=np.int16)
+        self.next_hops = np.full((n, n), -1, dtype=hop_type)
+        np.fill_diagonal(self.costs, 0)
+        np.fill_diagonal(self.next_hops, np.arange(n, dtype=hop_type))
+        self.rounds = 0
+
+        # Routers whose tables changed in the last round. A message can only
+        # change the receiver's table if the sender's or the receiver's table
+        # has changed since the receiver last handled that sender's message
+        self.dirty = np.ones(n, dtype=bool)
+
+    def build_slots(self):
+        """
+        Groups the links into slots, where slot k holds the k-th neighbour of
+        every router which has one. Each router handles the messages of its
+        neighbours one at a time, so a round handles one slot at a time, with
+        all routers in the slot updated together
+        """
+        self.slots = []
+        for k in range(max((len(x) for x in self.neighbours), default=0)):
+            receivers = [j for j, x in enumerate(self.neighbours) if len(x) > k]
+            self.slots.append((
+                np.array(receivers, dtype=np.intp),
+                np.array([self.neighbours[j][k][0] for j in receivers], dtype=np.intp),
+                np.array([[self.neighbours[j][k][1]] for j in receivers], dtype=np.int16),
+            ))
+
+    def step(self):
+        """
+        Runs one round, returning the number of table entries which changed.
+        Messages which cannot change anything are skipped
+        """
+        # Every message in a round is built from the tables as they were
+        # at the start of it
+        sent_costs = self.costs.copy()
+        sent_hops = self.next_hops
+        costs, next_hops = self.costs, self.next_hops.copy()
+
+        changed = 0
+        changed_rows = np.zeros(len(self.router_ids), dtype=bool)
+        for receivers, senders, link_costs in self.slots:
+            active = self.dirty[senders] | self.dirty[receivers] | changed_rows[receivers]
+            if not active.any():
+                continue
+            receivers, senders, link_costs = receivers[active], senders[active], link_costs[active]
+
+            # Split horizon with poisoned reverse: routes through the receiver
+            # are advertised as unreachable
+            advertised = sent_costs[senders]
+            advertised[sent_hops[senders] == receivers[:, None]] = INFINITY
+            candidate = np.minimum(advertised + link_costs, INFINITY)
+
+            current_costs = costs[receivers]
+            current_hops = next_hops[receivers]
+            from_authority = current_hops == senders[:, None]
+            # Take the authority's value if it differs, or any better route
+            take = np.where(from_authority, candidate != current_costs, candidate < current_costs)
+
+            costs[receivers] = np.where(take, candidate, current_costs)
+            next_hops[receivers] = np.where(take, senders[:, None], current_hops)
+            changed += int(np.count_nonzero(take))
+            changed_rows[receivers[take.any(axis=1)]] = True
+
+        self.next_hops = next_hops
+        self.dirty = changed_rows
+        self.rounds += 1
+        return changed
+
+    def run(self, max_rounds):
+        """
+        Runs rounds until nothing changes or max_rounds have run. Returns the
+        number of rounds in which something changed
+        """
+        for round_number in range(max_rounds):
+            if self.step() == 0:
+                return round_number
+        return max_rounds
+
+    def fail_link(self, router_a, router_b):
+        """
+        Removes the link between two routers in both directions. The routes
+        through the failed link become unreachable, as they would once they
+        timed out
+        """
+        a, b = self.index[router_a], self.index[router_b]
+        self.neighbours[a] = [x for x in self.neighbours[a] if x[0] != b]
+        self.neighbours[b] = [x for x in self.neighbours[b] if x[0] != a]
+        self.costs[a][self.next_hops[a] == b] = INFINITY
+        self.costs[b][self.next_hops[b] == a] = INFINITY
+        self.dirty[a] = self.dirty[b] = True
+        self.build_slots()
+
+    def table(self, router_id):
+        """
+        Returns the reachable routes of a router as {destination: (cost, next_hop)}
+        """
+        i = self.index[router_id]
+        ids = self.router_ids
+        return {ids[d]: (int(self.costs[i, d]), ids[self.next_hops[i, d]])
+            for d in np.flatnonzero(self.costs[i] < INFINITY)}
+
+    def max_cost(self):
+        """
+        Returns the highest cost of any reachable route, which climbs by a
+        little every round while the network counts to infinity
+        """
+        reachable = self.costs[self.costs < INFINITY]
+        return int(reachable.max()) if reachable.size else 0
+
+
+def load_lockstep(configs):
+    """
+    Reads the configuration files (or RouterConfigs) of every router and
+    returns a LockstepNetwork
+    """
+    return LockstepNetwork(read_links(configs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run distance vector rounds in lockstep")
+    parser.add_argument("configs", nargs="*",
+        help="configuration file of each router, or directories of configuration files")
+    parser.add_argument("--topology", metavar="FILE", help="read the whole network from a topology file")
+    parser.add_argument("--rounds", type=int, default=10000, help="maximum number of rounds")
+    parser.add_argument("--fail", metavar="A-B", help="fail the link between routers A and B once converged")
+    parser.add_argument("--table", type=int, help="print the final table of this router")
+    arguments = parser.parse_args()
+
+    network = load_lockstep(load_network(arguments.configs, arguments.topology))
+    start = time.perf_counter()
+    rounds = network.run(arguments.rounds)
+    print("Converged in {} rounds ({:.3f} s) with {} routers".format(
+        rounds, time.perf_counter() - start, len(network.router_ids)))
+
+    if arguments.fail:
+        try:
+            router_a, router_b = [int(x) for x in arguments.fail.split("-")]
+        except ValueError:
+            print(arguments.fail, "does not follow the format (A-B)")
+            sys.exit()
+        network.fail_link(router_a, router_b)
+        start = time.perf_counter()
+        for round_number in range(arguments.rounds):
+            changed = network.step()
+            print("round {}: {} changes, highest cost {}".format(round_number + 1, changed, network.max_cost()))
+            if changed == 0:
+                break
+        print("Reconverged in {:.3f} s".format(time.perf_counter() - start))
+
+    if arguments.table is not None:
+        print("Address | Next Hop | Cost")
+        for dest, (cost, next_hop) in sorted(network.table(arguments.table).items()):
+            print("{} | {} | {}".format(str(dest).center(7), str(next_hop).center(8), str(cost).center(4)))
+
+
+if __name__ == "__main__":
+    main()
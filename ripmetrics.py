@@ -0,0 +1,272 @@
+"""
+Metrics for a running router: counters and histograms which the router
+updates as it works, a small HTTP server which serves them (as JSON or in
+the Prometheus text format) on a localhost port or a Unix socket, and a
+sampling profiler which can be served alongside them
+
+Endpoints:
+    /metrics        Prometheus text format
+    /metrics.json   the same values as JSON
+    /profile        stacks sampled by the profiler, one per line with the
+                    number of samples (the collapsed format read by
+                    flamegraph tools), if the profiler is running
+
+Christopher Stewart (cst141) 21069553
+Frederik Markwell (fma107) 51118501
+"""
+
+import bisect, collections, json, os, socket, sys, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds of the histogram buckets for the time taken by the router's
+# hot paths, in seconds
+DURATION_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1)
+
+# Upper bounds of the histogram buckets for packet sizes, which are the sizes
+# of messages with 1, 5, 10, 15, 20 and 25 entries
+PACKET_SIZE_BUCKETS = (24, 104, 204, 304, 404, 504, 4096)
+
+# Default time between samples taken by the profiler, in seconds
+PROFILE_INTERVAL = 0.005
+
+
+class Histogram():
+    """
+    Counts of observed values falling into each bucket, along with their
+    number and sum. Buckets are kept separately and only made cumulative
+    (as Prometheus expects) when exported
+    """
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1) # the last bucket is +Inf
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        Returns a list of (upper bound, number of values at or below it)
+        """
+        total = 0
+        buckets = []
+        for bound, count in zip(list(self.bounds) + ["+Inf"], self.counts):
+            total += count
+            buckets.append((bound, total))
+        return buckets
+
+
+class Metrics():
+    """
+    The counters, histograms and gauges of one router. Each is identified by
+    a name and a set of labels, such as direction="in". Gauges are functions
+    called when the metrics are exported
+    """
+    def __init__(self, prefix="rip_"):
+        self.prefix = prefix
+        # key=(name, labels), where labels is a sorted tuple of (label, value)
+        # with every value a string
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        self.descriptions = {}
+
+    def describe(self, name, description):
+        self.descriptions[name] = description
+
+    def count(self, name, value=1, **labels):
+        key = (name, label_key(labels))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, bounds=DURATION_BUCKETS, **labels):
+        key = (name, label_key(labels))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(bounds)
+        histogram.observe(value)
+
+    def gauge(self, name, function):
+        """
+        Registers a function returning the current value of a gauge
+        """
+        self.gauges[(name, ())] = function
+
+    def to_dict(self):
+        """
+        Returns all values as a dictionary which can be written as JSON.
+        Labelled values are listed along with their labels
+        """
+        result = {}
+        for (name, labels), value in list(self.counters.items()):
+            result.setdefault(self.prefix + name, []).append({"labels": dict(labels), "value": value})
+        for (name, labels), function in list(self.gauges.items()):
+            result.setdefault(self.prefix + name, []).append({"labels": dict(labels), "value": function()})
+        for (name, labels), histogram in list(self.histograms.items()):
+            result.setdefault(self.prefix + name, []).append({
+                "labels": dict(labels),
+                "buckets": [[str(bound), count] for bound, count in histogram.cumulative()],
+                "sum": histogram.sum,
+                "count": histogram.count,
+            })
+        return result
+
+    def to_prometheus(self):
+        """
+        Returns all values in the Prometheus text exposition format
+        """
+        lines = []
+        written = set()
+
+        def header(name, kind):
+            if name not in written:
+                written.add(name)
+                if name in self.descriptions:
+                    lines.append("# HELP {}{} {}".format(self.prefix, name, self.descriptions[name]))
+                lines.append("# TYPE {}{} {}".format(self.prefix, name, kind))
+
+        for (name, labels), value in sorted(self.counters.items()):
+            header(name, "counter")
+            lines.append("{}{}{} {}".format(self.prefix, name, format_labels(labels), value))
+        for (name, labels), function in sorted(self.gauges.items()):
+            header(name, "gauge")
+            lines.append("{}{}{} {}".format(self.prefix, name, format_labels(labels), function()))
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            header(name, "histogram")
+            for bound, count in histogram.cumulative():
+                lines.append("{}{}_bucket{} {}".format(self.prefix, name,
+                    format_labels(labels + (("le", bound),)), count))
+            lines.append("{}{}_sum{} {}".format(self.prefix, name, format_labels(labels), histogram.sum))
+            lines.append("{}{}_count{} {}".format(self.prefix, name, format_labels(labels), histogram.count))
+        return "\n".join(lines) + "\n"
+
+
+def label_key(labels):
+    return tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(label, value) for label, value in labels) + "}"
+
+
+class SamplingProfiler():
+    """
+    Samples the stack of one thread (by default the one which creates the
+    profiler) from a background thread every interval seconds, counting how
+    often each stack is seen. Cheap enough to leave running on a busy router
+    """
+    def __init__(self, interval=PROFILE_INTERVAL, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.samples = collections.Counter()
+        self.sample_count = 0
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.sample_loop, name="profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def sample_loop(self):
+        while self.running:
+            time.sleep(self.interval)
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append("{}:{}".format(os.path.basename(code.co_filename), code.co_name))
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+            self.sample_count += 1
+
+    def collapsed(self):
+        """
+        Returns the samples as lines of "outer;...;inner count", most common first
+        """
+        samples = collections.Counter(self.samples.copy()) # copied while the sampler runs
+        return "".join("{} {}\n".format(stack, count) for stack, count in samples.most_common())
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            self.reply(self.server.metrics.to_prometheus(), "text/plain; version=0.0.4")
+        elif self.path == "/metrics.json":
+            self.reply(json.dumps(self.server.metrics.to_dict(), indent=1), "application/json")
+        elif self.path == "/profile" and self.server.profiler:
+            self.reply(self.server.profiler.collapsed(), "text/plain")
+        else:
+            self.send_error(404)
+
+    def reply(self, body, content_type):
+        body = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # requests are not printed over the router's table
+
+    def address_string(self):
+        return str(self.client_address)
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """
+    Serves a router's metrics on a localhost port from a background thread
+    """
+    daemon_threads = True
+
+    def __init__(self, metrics, address, profiler=None):
+        self.metrics = metrics
+        self.profiler = profiler
+        super().__init__(address, MetricsHandler)
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name="metrics", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        if self.thread:
+            self.shutdown()
+            self.thread = None
+        self.server_close()
+
+
+class UnixMetricsServer(MetricsServer):
+    """
+    Serves a router's metrics on a Unix socket, at the path given as address
+    """
+    address_family = socket.AF_UNIX
+
+    def __init__(self, metrics, address, profiler=None):
+        if os.path.exists(address):
+            os.unlink(address)
+        super().__init__(metrics, address, profiler)
+
+    def server_bind(self):
+        # HTTPServer.server_bind expects a host and port
+        self.socket.bind(self.server_address)
+        self.server_name = self.server_address
+        self.server_port = 0
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
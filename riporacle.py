@@ -0,0 +1,212 @@
+"""
+Shortest-path oracle for checking the tables RIP routers converge to. Loads a
+network from the routers' configuration files, stores its links as a
+compressed sparse row (CSR) adjacency, and runs Dijkstra's algorithm from
+every router, stopping at RIP's infinite metric of 16. Only the
+routers within 15 of a source are visited, so large sparse networks are
+checked quickly: computing the costs of every router in a 10,000 router ring
+or grid takes under a second. Where most routers are within reach of each
+other, as in a random network, every search visits the whole network, and
+the same takes about 25 s in pure Python. Each router's expected costs are
+kept as one byte per router (100 MB for 10,000 routers), rather than as a
+table of routes, so memory grows with the square of the network but stays
+small enough for 10,000 routers
+
+Christopher Stewart (cst141) 21069553
+Frederik Markwell (fma107) 51118501
+"""
+
+import argparse
+from array import array
+from parseutils import load_config
+from ripd import INFINITY
+from riptopology import load_network
+
+
+class Oracle():
+    """
+    The expected routing tables of a network. Router i's cost to a
+    neighbour is the cost in i's own configuration file, so links do not
+    have to cost the same in both directions
+    """
+    def __init__(self, links):
+        """
+        Builds the CSR adjacency from a list of (router_id, neighbour_id, cost)
+        """
+        self.router_ids = sorted({a for a, _, _ in links} | {b for _, b, _ in links})
+        self.index = {router_id: i for i, router_id in enumerate(self.router_ids)}
+
+        # The neighbours of router i are indices[indptr[i]:indptr[i+1]], with
+        # the costs to them at the same positions in weights
+        counts = [0] * (len(self.router_ids) + 1)
+        for a, _, _ in links:
+            counts[self.index[a] + 1] += 1
+        self.indptr = counts
+        for i in range(len(self.router_ids)):
+            self.indptr[i + 1] += self.indptr[i]
+        self.indices = [0] * len(links)
+        self.weights = [0] * len(links)
+        position = self.indptr[:-1]
+        for a, b, cost in links:
+            i = self.index[a]
+            self.indices[position[i]] = self.index[b]
+            self.weights[position[i]] = cost
+            position[i] += 1
+
+        # Expected cost from each router to every router (by index), filled
+        # in lazily by cost_row, key=router_id. A row is one byte per router,
+        # so the costs of a 10,000 router network take 100 MB; the next hops
+        # are not kept, as checking a table only needs the costs
+        self.costs = {}
+        self.unreachable = array('B', [INFINITY]) * len(self.router_ids)
+        self.no_hop = array('i', [-1]) * len(self.router_ids)
+
+    def shortest_paths(self, source):
+        """
+        Runs Dijkstra's algorithm from one router (by index), returning arrays
+        of the cost (INFINITY if 16 or more) and the first hop (-1 if
+        unreachable) to every router by index, and a list of the routers
+        reached. Costs are whole numbers below INFINITY, so a list of buckets
+        (one for each cost) is used as the priority queue
+        """
+        indptr, indices, weights = self.indptr, self.indices, self.weights
+        distance = self.unreachable[:]
+        first_hop = self.no_hop[:]
+        distance[source] = 0
+        first_hop[source] = source
+        buckets = [[] for _ in range(INFINITY)]
+        buckets[0].append(source)
+        reached = []
+        for d in range(INFINITY):
+            for u in buckets[d]:
+                if distance[u] != d:
+                    continue # already reached at a lower cost
+                reached.append(u)
+                hop = first_hop[u]
+                for k in range(indptr[u], indptr[u + 1]):
+                    v = indices[k]
+                    new_distance = d + weights[k]
+                    if new_distance < distance[v]:
+                        distance[v] = new_distance
+                        first_hop[v] = v if u == source else hop
+                        buckets[new_distance].append(v)
+        return distance, first_hop, reached
+
+    def cost_row(self, router_id):
+        """
+        Returns the expected cost from a router to every router, by index
+        """
+        row = self.costs.get(router_id)
+        if row is None:
+            row, _, _ = self.shortest_paths(self.index[router_id])
+            self.costs[router_id] = row
+        return row
+
+    def routes(self, router_id):
+        """
+        Returns the expected table of a router as {destination: (cost, next_hop)}
+        """
+        distance, first_hop, reached = self.shortest_paths(self.index[router_id])
+        self.costs.setdefault(router_id, distance)
+        ids = self.router_ids
+        return {ids[dest]: (distance[dest], ids[first_hop[dest]]) for dest in reached}
+
+    def tables(self):
+        """
+        Yields (router_id, expected table) for every router in turn, so only
+        one table is held at a time
+        """
+        for router_id in self.router_ids:
+            yield router_id, self.routes(router_id)
+
+    def cost(self, router_id, dest):
+        """
+        Returns the cost of the shortest path, or INFINITY if it is 16 or more
+        """
+        dest_index = self.index.get(dest)
+        return INFINITY if dest_index is None else self.cost_row(router_id)[dest_index]
+
+    def link_cost(self, router_id, neighbour_id):
+        i = self.index[router_id]
+        for k in range(self.indptr[i], self.indptr[i + 1]):
+            if self.router_ids[self.indices[k]] == neighbour_id:
+                return self.weights[k]
+        return INFINITY
+
+    def check_table(self, router_id, table):
+        """
+        Compares a router's table (dict of destination: Row) with the expected
+        one. A next hop is accepted if it is on any shortest path, as RIP keeps
+        whichever equal cost route it heard first. Returns a list of problems,
+        which is empty if the table is correct
+        """
+        expected = self.cost_row(router_id)
+        i = self.index[router_id]
+        link_costs = {} # cost to each neighbour, as link_cost returns
+        for k in range(self.indptr[i], self.indptr[i + 1]):
+            link_costs.setdefault(self.router_ids[self.indices[k]], self.weights[k])
+        problems = []
+        routed = 0 # reachable routes the router should have
+        for dest, row in table.items():
+            if row.cost >= INFINITY:
+                continue # unreachable routes are kept for a while before deletion
+            dest_index = self.index.get(dest)
+            expected_cost = INFINITY if dest_index is None else expected[dest_index]
+            if expected_cost >= INFINITY:
+                problems.append("{}: has route to {} which should be unreachable".format(router_id, dest))
+                continue
+            routed += 1
+            if row.cost != expected_cost:
+                problems.append("{}: cost to {} is {}, should be {}".format(
+                    router_id, dest, row.cost, expected_cost))
+            elif dest != router_id and (row.next_hop not in link_costs or link_costs[row.next_hop]
+                    + self.cost_row(row.next_hop)[dest_index] != row.cost):
+                problems.append("{}: next hop to {} is {}, which is not on a shortest path".format(
+                    router_id, dest, row.next_hop))
+        # Only look for missing routes if there are fewer than there should be
+        if routed < len(expected) - expected.count(INFINITY):
+            for dest_index, cost in enumerate(expected):
+                dest = self.router_ids[dest_index]
+                if cost < INFINITY and (dest not in table or table[dest].cost >= INFINITY):
+                    problems.append("{}: has no route to {}".format(router_id, dest))
+        return problems
+
+
+def read_links(filenames):
+    """
+    Reads the configuration files (or RouterConfigs) of every router in a
+    network and returns its links as a list of (router_id, neighbour_id,
+    cost), in the order the neighbours appear in each file
+    """
+    links = []
+    for filename in filenames:
+        instance_id, _, neighbour_info, _, _, _ = load_config(filename)
+        links += [(instance_id, neighbour_id, cost) for _, cost, neighbour_id in neighbour_info]
+    return links
+
+
+def load_topology(configs):
+    """
+    Reads the configuration files (or RouterConfigs) of every router in a
+    network and returns an Oracle for it
+    """
+    return Oracle(read_links(configs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the table a router should converge to")
+    parser.add_argument("router_id", type=int, help="router whose expected table is printed")
+    parser.add_argument("configs", nargs="*",
+        help="configuration file of each router, or directories of configuration files")
+    parser.add_argument("--topology", metavar="FILE", help="read the whole network from a topology file")
+    arguments = parser.parse_args()
+    oracle = load_topology(load_network(arguments.configs, arguments.topology))
+    router_id = arguments.router_id
+    print("Expected table for", router_id)
+    print("Address | Next Hop | Cost")
+    for dest, (cost, next_hop) in sorted(oracle.routes(router_id).items()):
+        print("{} | {} | {}".format(str(dest).center(7), str(next_hop).center(8), str(cost).center(4)))
+
+
+if __name__ == "__main__":
+    main()
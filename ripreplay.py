@@ -0,0 +1,171 @@
+"""
+Replays a trace recorded by a router (see riptrace) offline and at full
+speed. A new router is built from the same configuration file and options,
+and given any routes the recorded router restored from a snapshot. Each
+recorded event is fed back through it with its clock and random generator
+returning the recorded values. The packets it sends and its tables are
+compared with the recorded ones, and any differences are printed
+
+Christopher Stewart (cst141) 21069553
+Frederik Markwell (fma107) 51118501
+"""
+
+import argparse, sys, time
+from ripd import RIP_Router
+from riptrace import (START, RECV, TIMER, CLOCK, RNG, SEND, TABLE, RESTORE,
+    RESTORED_ROUTE, read_trace, decode_table)
+from riptransport import Transport
+
+
+class ReplayValues():
+    """
+    Returns the values recorded while handling one event in order. If the
+    replayed router reads more values than were recorded, it has diverged
+    from the recording; the last value is repeated and the read is counted
+    """
+    def __init__(self):
+        self.values = []
+        self.position = 0
+        self.last = 0.0
+        self.missing = 0
+
+    def load(self, values):
+        self.values = values
+        self.position = 0
+
+    def next(self):
+        if self.position < len(self.values):
+            self.last = self.values[self.position]
+            self.position += 1
+        else:
+            self.missing += 1
+        return self.last
+
+
+class ReplayClock(ReplayValues):
+    def __call__(self):
+        return self.next()
+
+
+class ReplayRandom(ReplayValues):
+    def random(self):
+        return self.next()
+
+
+class ReplayTransport(Transport):
+    """
+    Keeps the packets sent by the replayed router instead of sending them
+    """
+    def __init__(self):
+        super().__init__()
+        self.sent = []
+
+    def send_now(self, packet, addr_port):
+        self.sent.append((addr_port, bytes(packet)))
+
+
+def group_events(records):
+    """
+    Groups the records into events. Returns a list of (kind, payload,
+    clock values, random values, sent packets, tables) where the first
+    event (kind None) holds the values read while the router was created,
+    and its payload the routes it restored from a snapshot
+    """
+    events = [[None, [], [], [], [], []]]
+    for kind, port, payload in records:
+        if kind in (START, RECV, TIMER):
+            events.append([kind, payload, [], [], [], []])
+        elif kind == CLOCK:
+            events[-1][2].append(payload)
+        elif kind == RNG:
+            events[-1][3].append(payload)
+        elif kind == SEND:
+            events[-1][4].append((port, payload))
+        elif kind == TABLE:
+            events[-1][5].append(decode_table(payload))
+        elif kind == RESTORE:
+            events[0][1] = list(RESTORED_ROUTE.iter_unpack(payload))
+    return events
+
+
+def diff_tables(recorded, replayed):
+    """
+    Returns a line for each destination whose route differs between two
+    tables of {destination: (cost, next_hop)}
+    """
+    lines = []
+    for dest in sorted(set(recorded) | set(replayed)):
+        if recorded.get(dest) != replayed.get(dest):
+            lines.append("    {}: recorded {}, replayed {}".format(dest, recorded.get(dest), replayed.get(dest)))
+    return lines
+
+
+def replay(trace_filename, config_filename=None):
+    """
+    Replays a trace, returning (number of events, list of differences). The
+    configuration file recorded in the trace is used unless another is given
+    """
+    recorded_config, options, records = read_trace(trace_filename)
+    events = group_events(records)
+    clock = ReplayClock()
+    rng = ReplayRandom()
+    transport = ReplayTransport()
+
+    clock.load(events[0][2])
+    rng.load(events[0][3])
+    router = RIP_Router(config_filename or recorded_config, verbose=False, display=False,
+        clock=clock, rng=rng, transport=transport, **options)
+    router.restore_routes(events[0][1])
+    router.open()
+
+    differences = []
+    for number, (kind, payload, clock_values, random_values, sent, tables) in enumerate(events):
+        if kind is not None:
+            clock.load(clock_values)
+            rng.load(random_values)
+            transport.sent = []
+            if kind == START:
+                router.start_updates()
+            elif kind == RECV:
+                router.handle_packet(payload)
+            elif kind == TIMER:
+                router.process_timers()
+            if transport.sent != sent:
+                differences.append("event {} at {:.3f}: sent {} packets, recorded {} (or their contents differ)".format(
+                    number, clock.last, len(transport.sent), len(sent)))
+
+        replayed = {dest: (row.cost, row.next_hop) for dest, row in router.table.items()}
+        for table in tables:
+            lines = diff_tables(table, replayed)
+            if lines:
+                differences.append("event {} at {:.3f}: tables differ".format(number, clock.last))
+                differences += lines
+
+    if clock.missing or rng.missing:
+        differences.append("the router read its clock {} and random generator {} more times than recorded".format(
+            clock.missing, rng.missing))
+    return len(events) - 1, differences
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a router's trace and compare the results")
+    parser.add_argument("trace", help="trace file recorded with ripd.py --trace")
+    parser.add_argument("--config", help="configuration file to use instead of the recorded one")
+    arguments = parser.parse_args()
+
+    start = time.perf_counter()
+    try:
+        events, differences = replay(arguments.trace, arguments.config)
+    except (OSError, ValueError) as e:
+        print(e)
+        sys.exit()
+    elapsed = time.perf_counter() - start
+
+    for line in differences:
+        print(line)
+    print("Replayed {} events in {:.3f} s, {}".format(events, elapsed,
+        "with no differences" if not differences else "with differences"))
+
+
+if __name__ == "__main__":
+    main()
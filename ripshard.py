@@ -0,0 +1,427 @@
+"""
+Runs a large simulated network across a pool of worker processes, one shard
+of routers in each. The routers are partitioned so that neighbours are
+usually in the same shard. Packets between routers in the same shard are
+delivered in memory as in ripsim, and packets to routers in other shards are
+written to shared memory ring buffers, one for each pair of shards with links
+between them.
+
+The shards advance their simulated clocks in windows no longer than the link
+latency. A packet sent in one window cannot arrive before the next, so the
+shards only have to meet at a barrier once per window to exchange packets.
+Windows in which no shard has anything to do are skipped.
+
+Christopher Stewart (cst141) 21069553
+Frederik Markwell (fma107) 51118501
+"""
+
+import argparse, heapq, math, os, struct, time
+import multiprocessing as mp
+from collections import deque
+from multiprocessing import shared_memory
+from parseutils import load_config
+from riporacle import Oracle
+from ripsim import Simulator, DEFAULT_LATENCY
+from riptransport import MemoryNetwork
+from riptopology import load_network
+
+# Default number of bytes in each ring buffer
+RING_SIZE = 1 << 20
+
+# Layout of a ring buffer: the total bytes ever written (tail) and read
+# (head), followed by the records. Each record is a header, then the packet
+RING_HEADER = struct.Struct('<QQ') # head, tail
+RECORD_HEADER = struct.Struct('<IdIH') # window, delivery time, port, length
+
+# Length of a record marking that the rest of the buffer is skipped
+SKIP = 0xFFFF
+
+
+class RingBuffer():
+    """
+    A single producer, single consumer queue of packets in shared memory.
+    Records never wrap part way: if one does not fit before the end of the
+    buffer, the rest of the buffer is skipped (marked by a SKIP record if
+    there is room for one). The producer only moves the tail and the
+    consumer only moves the head, so the two never need a lock
+    """
+    def __init__(self, capacity=RING_SIZE):
+        self.capacity = capacity
+        self.memory = shared_memory.SharedMemory(create=True, size=RING_HEADER.size + capacity)
+        self.buffer = self.memory.buf
+        RING_HEADER.pack_into(self.buffer, 0, 0, 0)
+
+    def write(self, window, when, port, packet):
+        """
+        Appends a packet, returning False (and dropping it) if the ring is full
+        """
+        head, tail = RING_HEADER.unpack_from(self.buffer)
+        size = RECORD_HEADER.size + len(packet)
+        position = tail % self.capacity
+        skip = 0
+        if position + size > self.capacity:
+            skip = self.capacity - position
+            position = 0
+        if tail + skip + size - head > self.capacity:
+            return False
+        if skip >= RECORD_HEADER.size:
+            RECORD_HEADER.pack_into(self.buffer, RING_HEADER.size + tail % self.capacity, window, 0, 0, SKIP)
+        start = RING_HEADER.size + position
+        RECORD_HEADER.pack_into(self.buffer, start, window, when, port, len(packet))
+        start += RECORD_HEADER.size
+        self.buffer[start:start + len(packet)] = packet
+        # The tail is written last so the record is complete when it is seen
+        struct.pack_into('<Q', self.buffer, 8, tail + skip + size)
+        return True
+
+    def read(self, window):
+        """
+        Yields (delivery time, port, packet) for every record written in or
+        before the given window. Records from later windows are left for the
+        next read
+        """
+        head, tail = RING_HEADER.unpack_from(self.buffer)
+        while head < tail:
+            position = head % self.capacity
+            if position + RECORD_HEADER.size > self.capacity:
+                head += self.capacity - position # skipped by the producer
+                continue
+            start = RING_HEADER.size + position
+            record_window, when, port, length = RECORD_HEADER.unpack_from(self.buffer, start)
+            if length == SKIP:
+                head += self.capacity - position
+                continue
+            if record_window > window:
+                break
+            start += RECORD_HEADER.size
+            packet = bytes(self.buffer[start:start + length])
+            head += RECORD_HEADER.size + length
+            yield when, port, packet
+        struct.pack_into('<Q', self.buffer, 0, head)
+
+    def close(self):
+        self.buffer = None
+        self.memory.close()
+
+    def unlink(self):
+        self.memory.unlink()
+
+
+class ShardNetwork(MemoryNetwork):
+    """
+    A MemoryNetwork which writes packets for ports owned by other shards to
+    the ring buffer leading to that shard
+    """
+    def __init__(self, scheduler, remote_rings):
+        super().__init__(scheduler)
+        # key=port owned by another shard, value=RingBuffer to that shard
+        self.remote_rings = remote_rings
+        self.window = 0
+        self.remote_packets = 0
+        self.ring_full = 0
+
+        # Earliest delivery time of the packets sent to other shards in the
+        # current window
+        self.earliest_remote = math.inf
+
+    def deliver(self, packet, addr_port, latency):
+        ring = self.remote_rings.get(addr_port)
+        if ring is None:
+            super().deliver(packet, addr_port, latency)
+            return
+        self.packets_sent += 1
+        self.bytes_sent += len(packet)
+        self.remote_packets += 1
+        when = self.scheduler.time() + latency
+        if ring.write(self.window, when, addr_port, packet):
+            self.earliest_remote = min(self.earliest_remote, when)
+        else:
+            # Like a full socket queue, the packet is lost
+            self.packets_dropped += 1
+            self.ring_full += 1
+
+
+class ShardSimulator(Simulator):
+    """
+    The Simulator of one shard, which exchanges packets with the other shards
+    through ring buffers
+    """
+    def __init__(self, filenames, remote_rings, latency=DEFAULT_LATENCY, seed=None, loss=0):
+        super().__init__(filenames, latency, seed, loss=loss,
+            network=ShardNetwork(self, remote_rings))
+
+    def next_event_time(self):
+        """
+        Returns the time of the next event which has not been cancelled
+        """
+        while self.events and self.events[0][2].cancelled:
+            heapq.heappop(self.events)
+        return self.events[0][0] if self.events else math.inf
+
+    def receive_remote(self, rings, window):
+        """
+        Schedules the delivery of the packets written to the inbound rings up
+        to the given window. The rings are read in shard order, so runs with
+        the same seed are repeatable
+        """
+        received = 0
+        for ring in rings:
+            for when, port, packet in ring.read(window):
+                receiver = self.network.port_owners.get(port)
+                if receiver is None:
+                    self.network.packets_dropped += 1
+                    continue
+                self.call_at(when, receiver.receive, packet)
+                received += 1
+        return received
+
+
+class WindowBarrier():
+    """
+    Where the shards meet at the end of each window. If there is a core for
+    each shard, each shard counts the windows it has finished in its own slot
+    of a shared array (so no lock is needed) and waits by polling until every
+    slot has caught up, which is much quicker than multiprocessing.Barrier.
+    Otherwise polling would take time from the shards still working, so
+    multiprocessing.Barrier is used
+    """
+    def __init__(self, context, parties):
+        self.finished = None
+        self.barrier = None
+        if parties <= os.cpu_count():
+            self.finished = context.Array('q', parties, lock=False)
+        else:
+            self.barrier = context.Barrier(parties)
+
+    def wait(self, index, window):
+        if self.barrier:
+            self.barrier.wait()
+            return
+        self.finished[index] = window + 1
+        while min(self.finished) <= window:
+            time.sleep(0)
+
+
+class Shard():
+    """
+    The routers of one worker process and the ring buffers to and from the
+    shards it has links with
+    """
+    def __init__(self, index, filenames):
+        self.index = index
+        self.filenames = filenames
+        self.inbound = [] # RingBuffers, in order of the sending shard
+        self.outbound = {} # key=receiving shard index, value=RingBuffer
+        self.remote_ports = {} # key=port in another shard, value=shard index
+        self.cross_links = 0
+
+
+def partition(routers, shard_count):
+    """
+    Splits the routers (dict of router_id: list of neighbour_ids) into
+    shard_count groups of nearly equal size. The routers are ordered by a
+    breadth first search, which places neighbours close to each other, and
+    the order is cut into consecutive groups. Returns a list of lists of
+    router_ids
+    """
+    order = []
+    visited = set()
+    for root in sorted(routers):
+        if root in visited:
+            continue
+        visited.add(root)
+        queue = deque([root])
+        while queue:
+            router_id = queue.popleft()
+            order.append(router_id)
+            for neighbour_id in routers[router_id]:
+                if neighbour_id in routers and neighbour_id not in visited:
+                    visited.add(neighbour_id)
+                    queue.append(neighbour_id)
+    size = math.ceil(len(order) / shard_count)
+    return [order[i:i + size] for i in range(0, len(order), size)]
+
+
+def build_shards(filenames, shard_count, ring_size=RING_SIZE):
+    """
+    Reads every configuration file (or takes RouterConfigs in their place),
+    partitions the routers and creates the ring buffers between shards. The
+    shards are given the parsed configurations, so the workers do not read
+    the files again. Returns the shards and the network's links as a list of
+    (router_id, neighbour_id, cost)
+    """
+    configs = {}
+    links = []
+    for filename in filenames:
+        config = load_config(filename)
+        configs[config.instance_id] = config
+        links += [(config.instance_id, neighbour_id, cost) for _, cost, neighbour_id in config.neighbour_info]
+
+    groups = partition({router_id: [x[2] for x in config.neighbour_info] for router_id, config in configs.items()},
+        shard_count)
+    shards = [Shard(i, [configs[router_id] for router_id in group]) for i, group in enumerate(groups)]
+    port_shards = {}
+    for shard, group in zip(shards, groups):
+        for router_id in group:
+            for port in configs[router_id].input_ports:
+                port_shards[port] = shard.index
+
+    for shard, group in zip(shards, groups):
+        for router_id in group:
+            for output_port, _, _ in configs[router_id].neighbour_info:
+                other = port_shards.get(output_port, shard.index)
+                if other != shard.index:
+                    shard.remote_ports[output_port] = other
+                    shard.cross_links += 1
+
+    for receiver in shards:
+        for sender in shards:
+            if receiver.index in sender.remote_ports.values():
+                ring = RingBuffer(ring_size)
+                sender.outbound[receiver.index] = ring
+                receiver.inbound.append(ring)
+    return shards, links
+
+
+def run_shard(shard, duration, latency, loss, seed, next_times, barrier, results, links):
+    """
+    Runs one shard in a worker process, then puts its load report (and the
+    problems found in its tables, if links are given) on the results queue
+    """
+    remote_rings = {port: shard.outbound[other] for port, other in shard.remote_ports.items()}
+    # Each shard seeds its generators differently, but repeatably
+    simulator = ShardSimulator(shard.filenames, remote_rings, latency,
+        None if seed is None else "{}-{}".format(seed, shard.index), loss)
+    network = simulator.network
+    shard_count = len(next_times) // 2
+
+    start = time.perf_counter()
+    waiting = 0
+    windows = 0
+    events = 0
+    received = 0
+    simulator.start()
+    until = 0.0
+    while True:
+        events += simulator.run(until - simulator.time())
+        # Publish the earliest time this shard could next do anything. The
+        # values alternate between two halves of next_times, so a fast shard
+        # cannot overwrite a value before a slow shard has read it
+        half = (windows % 2) * shard_count
+        next_times[half + shard.index] = min(simulator.next_event_time(), network.earliest_remote)
+        network.earliest_remote = math.inf
+
+        wait_start = time.perf_counter()
+        barrier.wait(shard.index, windows)
+        waiting += time.perf_counter() - wait_start
+
+        received += simulator.receive_remote(shard.inbound, network.window)
+        windows += 1
+        network.window = windows
+        earliest = min(next_times[half:half + shard_count])
+        if earliest > duration:
+            break
+        until = min(earliest + latency, duration)
+    simulator.run(duration - simulator.time())
+    elapsed = time.perf_counter() - start
+
+    problems = None
+    if links is not None:
+        oracle = Oracle(links)
+        problems = sum(len(oracle.check_table(router_id, router.table))
+            for router_id, router in simulator.routers.items())
+    results.put({
+        "shard": shard.index,
+        "routers": len(simulator.routers),
+        "cross_links": shard.cross_links,
+        "events": events,
+        "packets": network.packets_sent,
+        "remote_packets": network.remote_packets,
+        "received_remote": received,
+        "ring_full": network.ring_full,
+        "bytes": network.bytes_sent,
+        "windows": windows,
+        "busy": elapsed - waiting,
+        "waiting": waiting,
+        "problems": problems,
+    })
+    for ring in shard.inbound + list(shard.outbound.values()):
+        ring.close()
+
+
+def run_sharded(filenames, shard_count, duration, latency=DEFAULT_LATENCY, loss=0, seed=None,
+        ring_size=RING_SIZE, check=False):
+    """
+    Runs a network in shard_count worker processes for duration simulated
+    seconds. Returns the load reports of the shards, ordered by shard
+    """
+    shards, links = build_shards(filenames, shard_count, ring_size)
+    # Worker processes are forked so that the shared memory, barrier and
+    # shards are inherited rather than pickled
+    context = mp.get_context("fork")
+    next_times = context.Array('d', 2 * len(shards), lock=False)
+    barrier = WindowBarrier(context, len(shards))
+    results = context.Queue()
+    workers = [context.Process(target=run_shard, args=(shard, duration, latency, loss, seed,
+        next_times, barrier, results, links if check else None)) for shard in shards]
+    try:
+        for worker in workers:
+            worker.start()
+        reports = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+    finally:
+        for shard in shards:
+            for ring in shard.outbound.values():
+                ring.close()
+                ring.unlink()
+    return sorted(reports, key=lambda x: x["shard"])
+
+
+def print_reports(reports):
+    """
+    Prints the load of each shard. Utilisation is the fraction of the time
+    the shard was working rather than waiting for the others at the barrier
+    """
+    headings = ["Shard", "Routers", "Cross links", "Events", "Packets", "Remote", "Busy (s)", "Utilisation"]
+    print((" | ").join(headings))
+    for report in reports:
+        total = report["busy"] + report["waiting"]
+        values = [report["shard"], report["routers"], report["cross_links"], report["events"],
+            report["packets"], report["remote_packets"], "{:.2f}".format(report["busy"]),
+            "{:.0%}".format(report["busy"] / total if total else 0)]
+        print((" | ").join(str(value).center(len(heading)) for value, heading in zip(values, headings)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate a large network of RIP routers across worker processes")
+    parser.add_argument("configs", nargs="*",
+        help="configuration file of each router, or directories of configuration files")
+    parser.add_argument("--topology", metavar="FILE", help="read the whole network from a topology file")
+    parser.add_argument("--shards", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--duration", type=float, default=300, help="simulated seconds to run for")
+    parser.add_argument("--seed", type=int, default=None, help="seed for the timer jitter")
+    parser.add_argument("--latency", type=float, default=DEFAULT_LATENCY,
+        help="link latency in seconds, which is also the length of each window")
+    parser.add_argument("--loss", type=float, default=0, help="probability of losing each packet")
+    parser.add_argument("--ring-size", type=int, default=RING_SIZE, help="bytes in each ring buffer")
+    parser.add_argument("--check", action="store_true", help="check the final tables against the shortest paths")
+    arguments = parser.parse_args()
+    filenames = load_network(arguments.configs, arguments.topology)
+
+    start = time.time()
+    reports = run_sharded(filenames, arguments.shards, arguments.duration, arguments.latency,
+        arguments.loss, arguments.seed, arguments.ring_size, arguments.check)
+    elapsed = time.time() - start
+
+    print_reports(reports)
+    print("\nSimulated {} s of {} routers in {:.2f} s ({} windows, {} packets, {} across shards, {} lost to full rings)".format(
+        arguments.duration, sum(x["routers"] for x in reports), elapsed, reports[0]["windows"],
+        sum(x["packets"] for x in reports), sum(x["remote_packets"] for x in reports),
+        sum(x["ring_full"] for x in reports)))
+    if arguments.check:
+        print("{} problems found in the tables".format(sum(x["problems"] for x in reports)))
+
+
+if __name__ == "__main__":
+    main()
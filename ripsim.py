@@ -0,0 +1,184 @@
+"""
+Discrete-event simulation of a network of RIP routers. The routers run against
+a virtual clock and a priority queue of packet deliveries and timer firings,
+so hours of protocol time pass in seconds of real time. Packets are carried
+by a MemoryNetwork. All timer jitter and packet loss comes from generators
+seeded from one seed, so a run can be repeated exactly
+
+Christopher Stewart (cst141) 21069553
+Frederik Markwell (fma107) 51118501
+"""
+
+import argparse, heapq, itertools, random, time
+from riphost import HostedRouter
+from riptransport import LinkConditions, MemoryNetwork, MemoryTransport
+from riptopology import load_network
+
+# Default one-way delay (in simulated seconds) of every link
+DEFAULT_LATENCY = 0.001
+
+
+class VirtualClock():
+    """
+    A clock which only moves when the simulator advances it. Routers call it
+    in place of time.monotonic
+    """
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class Event():
+    """
+    A callback scheduled to run at a simulated time. Can be cancelled in the
+    same way as the handles returned by asyncio's call_later
+    """
+    def __init__(self, when, callback, args):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class SimulatedRouter(HostedRouter):
+    """
+    A router which is scheduled by a Simulator and sends its packets through
+    the simulator's network, without creating any sockets
+    """
+    def __init__(self, simulator, filename, **kwargs):
+        super().__init__(filename, clock=simulator.clock,
+            transport=MemoryTransport(simulator.network, simulator.conditions), **kwargs)
+        self.loop = simulator
+
+
+class Simulator():
+    """
+    Runs a network of SimulatedRouters, one for each configuration file (or
+    RouterConfig).
+    Packets sent to an output port are delivered to the router owning that
+    input port after the link's latency, unless lost (with probability loss).
+    network may be given to carry packets other than through a MemoryNetwork
+    """
+    def __init__(self, filenames, latency=DEFAULT_LATENCY, seed=None, verbose=False, loss=0,
+            network=None):
+        self.clock = VirtualClock()
+        self.network = network if network is not None else MemoryNetwork(self)
+
+        # Latency and loss of every link, which may be set for individual links
+        self.conditions = LinkConditions(latency, loss, seed)
+
+        # Heap of (time, sequence_number, Event). The sequence number keeps
+        # events at the same time in the order they were scheduled
+        self.events = []
+        self.sequence = itertools.count()
+
+        # Each router gets its own generator, seeded in configuration order
+        seed_random = random.Random(seed)
+        self.routers = {}
+        for filename in filenames:
+            router = SimulatedRouter(self, filename, verbose=verbose,
+                rng=random.Random(seed_random.getrandbits(64)))
+            router.open()
+            self.routers[router.instance_id] = router
+
+    @property
+    def packets_sent(self):
+        return self.network.packets_sent
+
+    @property
+    def bytes_sent(self):
+        return self.network.bytes_sent
+
+    @property
+    def packets_dropped(self):
+        return self.network.packets_dropped
+
+    def time(self):
+        return self.clock.now
+
+    def call_at(self, when, callback, *args):
+        """
+        Schedules callback(*args) to run at the simulated time when
+        """
+        event = Event(when, callback, args)
+        heapq.heappush(self.events, (when, next(self.sequence), event))
+        return event
+
+    def call_later(self, delay, callback, *args):
+        """
+        Schedules callback(*args) to run delay simulated seconds from now
+        """
+        return self.call_at(self.clock.now + delay, callback, *args)
+
+    def set_link_latency(self, sender_id, receiver_id, latency):
+        self.conditions.set_link(sender_id, receiver_id, latency=latency)
+
+    def set_link_loss(self, sender_id, receiver_id, loss):
+        self.conditions.set_link(sender_id, receiver_id, loss=loss)
+
+    def start(self):
+        """
+        Starts the timers of every router
+        """
+        for router in self.routers.values():
+            router.start_timers()
+
+    def stop_router(self, router_id):
+        """
+        Simulates a router failing. It stops sending and packets to it are lost
+        """
+        router = self.routers.pop(router_id)
+        router.close()
+
+    def run(self, duration):
+        """
+        Processes events in time order until duration simulated seconds have
+        passed, returning the number of events processed
+        """
+        until = self.clock.now + duration
+        processed = 0
+        while self.events and self.events[0][0] <= until:
+            when, _, event = heapq.heappop(self.events)
+            if event.cancelled:
+                continue
+            self.clock.now = when
+            event.callback(*event.args)
+            processed += 1
+        self.clock.now = until
+        return processed
+
+    def print_tables(self):
+        for router_id in sorted(self.routers):
+            self.routers[router_id].print_table()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate a network of RIP routers in virtual time")
+    parser.add_argument("configs", nargs="*",
+        help="configuration file of each router, or directories of configuration files")
+    parser.add_argument("--topology", metavar="FILE", help="read the whole network from a topology file")
+    parser.add_argument("--duration", type=float, default=300, help="simulated seconds to run for")
+    parser.add_argument("--seed", type=int, default=None, help="seed for the timer jitter")
+    parser.add_argument("--latency", type=float, default=DEFAULT_LATENCY, help="link latency in seconds")
+    parser.add_argument("--loss", type=float, default=0, help="probability of losing each packet")
+    arguments = parser.parse_args()
+    configs = load_network(arguments.configs, arguments.topology)
+
+    simulator = Simulator(configs, arguments.latency, arguments.seed, loss=arguments.loss)
+    start = time.time()
+    simulator.start()
+    processed = simulator.run(arguments.duration)
+    elapsed = time.time() - start
+
+    simulator.print_tables()
+    print("\nSimulated {} s in {:.2f} s ({} events, {} packets, {} bytes)".format(
+        arguments.duration, elapsed, processed, simulator.packets_sent, simulator.bytes_sent))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Saves a router's table to a small binary file so that a restarted router can
+start from the routes it had rather than an empty table. The file is written
+to a temporary file beside it and renamed over it, so a router killed while
+saving leaves the previous snapshot intact.
+
+A snapshot is a header of (magic, version, router_id, time saved, number of
+routes) followed by a (destination, cost, next_hop, age) record for each
+route, where age is the time in seconds since the route was last refreshed.
+The time saved is wall clock time, as the router's clock does not carry over
+between runs
+
+Christopher Stewart (cst141) 21069553
+Frederik Markwell (fma107) 51118501
+"""
+
+import os, struct, time
+
+MAGIC = b"RIPSNAPS"
+VERSION = 1
+
+HEADER = struct.Struct('<8sBHdI') # magic, version, router_id, time saved, routes
+ROUTE = struct.Struct('<HBHd') # destination, cost, next_hop, age
+
+
+def save_snapshot(filename, router_id, table, now, saved_at=None):
+    """
+    Writes a table (dict of destination: Row) to filename atomically. now is
+    the router's current time, used to work out the age of each route, and
+    saved_at the wall clock time (by default time.time())
+    """
+    if saved_at is None:
+        saved_at = time.time()
+    routes = [ROUTE.pack(dest, row.cost, row.next_hop, max(0, now - row.last_response_time))
+        for dest, row in table.items() if dest != router_id]
+    data = HEADER.pack(MAGIC, VERSION, router_id, saved_at, len(routes)) + b"".join(routes)
+
+    temporary = filename + ".tmp"
+    with open(temporary, "wb") as snapshot_file:
+        snapshot_file.write(data)
+        snapshot_file.flush()
+        os.fsync(snapshot_file.fileno())
+    os.replace(temporary, filename)
+
+
+def load_snapshot(filename):
+    """
+    Reads a snapshot, returning (router_id, time saved, routes) where routes
+    is a list of (destination, cost, next_hop, age). Raises OSError if the
+    file cannot be read and ValueError if it is not a complete snapshot
+    """
+    with open(filename, "rb") as snapshot_file:
+        data = snapshot_file.read()
+    if len(data) < HEADER.size:
+        raise ValueError("{} is not a snapshot".format(filename))
+    magic, version, router_id, saved_at, count = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("{} is not a version {} snapshot".format(filename, VERSION))
+    if len(data) != HEADER.size + count * ROUTE.size:
+        raise ValueError("{} is incomplete".format(filename))
+    routes = list(ROUTE.iter_unpack(data[HEADER.size:]))
+    return router_id, saved_at, routes
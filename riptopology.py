@@ -0,0 +1,338 @@
+"""
+Describes a whole network in one topology file, which is read in a single
+pass and checked as a whole. Every problem found is reported at once rather
+than stopping at the first, and the RouterConfigs it produces are handed
+straight to routers in the same process (ripsim, riphost, ripshard) without
+writing a configuration file for each router.
+
+The format follows the router configuration files. Timers set before the
+first section apply to every router, and each [router N] section gives a
+router's input ports and may override its timers. The [links] section has a
+line for each link, giving the two routers and the cost of the link, which
+is the same in both directions. Each end receives on its first input port,
+unless a port is given after the router id:
+
+    periodic-update-time 5
+    route-timeout 30
+    garbage-time 20
+
+    [router 1]
+    input-ports 10001, 10002
+
+    [router 2]
+    input-ports 20001
+    route-timeout 60
+
+    [links]
+    1 2 3           # each router sends to the other's first input port
+    1:10002 2 4     # router 2 sends to router 1 on port 10002
+
+check_configs also checks a network described by separate configuration
+files: that every link is listed at both ends with the same cost, and that
+every output port is an input port of the router it leads to
+
+Christopher Stewart (cst141) 21069553
+Frederik Markwell (fma107) 51118501
+"""
+
+import argparse, os, sys
+from parseutils import RouterConfig, read_lines_from_file, load_config
+
+TIMER_KEYWORDS = {"route-timeout": "timeout", "periodic-update-time": "periodic_update_time",
+    "garbage-time": "garbage_time"}
+
+# Default timers, as in parse_config_file
+DEFAULT_TIMERS = {"timeout": 180, "periodic_update_time": 30, "garbage_time": 120}
+
+
+def parse_int(text, low, high, name, errors, where):
+    """
+    Returns text as an integer between low and high, or None (after adding
+    an error) if it is not one
+    """
+    if not text.isdigit():
+        errors.append("{}: {} is not a valid {} (non-integer)".format(where, text, name))
+        return None
+    value = int(text)
+    if not low <= value <= high:
+        errors.append("{}: {} is not a valid {} (must be between {} and {})".format(where, value, name, low, high))
+        return None
+    return value
+
+
+def parse_endpoint(text, errors, where):
+    """
+    Parses one end of a link, "router_id" or "router_id:port", returning
+    (router_id, port) where port is None if not given
+    """
+    router, _, port = text.partition(":")
+    router_id = parse_int(router, 1, 64000, "router_id", errors, where)
+    if port:
+        return router_id, parse_int(port, 1024, 64000, "port", errors, where)
+    return router_id, None
+
+
+def parse_topology(lines, source="topology"):
+    """
+    Reads the lines of a topology file, returning (configs, errors) where
+    configs is a list of RouterConfigs in the order the routers appear and
+    errors a list of every problem found. Runs in time proportional to the
+    size of the file
+    """
+    errors = []
+    defaults = dict(DEFAULT_TIMERS)
+    routers = {} # key=router_id, value=dict of the router's settings
+    links = [] # (where, router_a, port_a, router_b, port_b, cost)
+    section = None # None before the first section, else a router's settings or "links"
+
+    for number, line in enumerate(lines, 1):
+        where = "{}:{}".format(source, number)
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+
+        if line.startswith("["):
+            words = line.strip("[]").split()
+            if words == ["links"]:
+                section = "links"
+            elif len(words) == 2 and words[0] == "router":
+                router_id = parse_int(words[1], 1, 64000, "router_id", errors, where)
+                if router_id in routers:
+                    errors.append("{}: router {} is described more than once".format(where, router_id))
+                section = {"where": where, "input_ports": [], "timers": {}}
+                if router_id is not None and router_id not in routers:
+                    routers[router_id] = section
+            else:
+                errors.append("{}: unknown section {}".format(where, line))
+                section = {"where": where, "input_ports": [], "timers": {}} # skipped
+            continue
+
+        if section == "links":
+            words = line.split()
+            if len(words) != 3:
+                errors.append("{}: {} does not follow the format (router router cost)".format(where, line))
+                continue
+            router_a, port_a = parse_endpoint(words[0], errors, where)
+            router_b, port_b = parse_endpoint(words[1], errors, where)
+            cost = parse_int(words[2], 1, 16, "cost", errors, where)
+            if None not in (router_a, router_b, cost):
+                links.append((where, router_a, port_a, router_b, port_b, cost))
+            continue
+
+        keyword, _, value = line.partition(" ")
+        value = value.strip()
+        timers = defaults if section is None else section["timers"]
+        if keyword in TIMER_KEYWORDS:
+            timer = parse_int(value, 1, sys.maxsize, keyword, errors, where)
+            if timer is not None:
+                timers[TIMER_KEYWORDS[keyword]] = timer
+        elif keyword == "input-ports" and section is not None:
+            for port in value.split(","):
+                port = parse_int(port.strip(), 1024, 64000, "port", errors, where)
+                if port is not None:
+                    section["input_ports"].append(port)
+        else:
+            errors.append("{}: could not process {}".format(where, line))
+
+    # Add each link to the routers at both ends
+    neighbours = {router_id: [] for router_id in routers}
+    linked = set()
+    for where, router_a, port_a, router_b, port_b, cost in links:
+        problem = False
+        for router_id, port in ((router_a, port_a), (router_b, port_b)):
+            if router_id not in routers:
+                errors.append("{}: router {} is not described".format(where, router_id))
+                problem = True
+            elif port is not None and port not in routers[router_id]["input_ports"]:
+                errors.append("{}: {} is not an input port of router {}".format(where, port, router_id))
+                problem = True
+            elif not routers[router_id]["input_ports"]:
+                problem = True # reported below
+        if router_a == router_b:
+            errors.append("{}: router {} is linked to itself".format(where, router_a))
+            problem = True
+        pair = (min(router_a, router_b), max(router_a, router_b))
+        if pair in linked:
+            errors.append("{}: routers {} and {} are linked more than once".format(where, *pair))
+            problem = True
+        linked.add(pair)
+        if problem:
+            continue
+        port_a = port_a or routers[router_a]["input_ports"][0]
+        port_b = port_b or routers[router_b]["input_ports"][0]
+        neighbours[router_a].append((port_b, cost, router_b))
+        neighbours[router_b].append((port_a, cost, router_a))
+
+    configs = []
+    for router_id, router in routers.items():
+        if not router["input_ports"]:
+            errors.append("{}: router {} has no input ports".format(router["where"], router_id))
+            continue
+        if not neighbours[router_id]:
+            errors.append("{}: router {} has no links".format(router["where"], router_id))
+            continue
+        timers = dict(defaults, **router["timers"])
+        configs.append(RouterConfig(router_id, router["input_ports"], neighbours[router_id],
+            timers["timeout"], timers["periodic_update_time"], timers["garbage_time"]))
+
+    errors += check_configs(configs)
+    return configs, errors
+
+
+def check_configs(configs):
+    """
+    Checks the configurations of every router in a network against each
+    other, returning a list of every problem found:
+        router ids or input ports used more than once
+        links from a router to itself
+        output ports which are not an input port of the neighbour they lead to
+        links listed by only one of the routers at their ends
+        links whose cost differs between their two ends
+    """
+    errors = []
+    port_owners = {}
+    port_configs = {} # key=port, value=position of the config listing it
+    router_ids = set()
+    for position, config in enumerate(configs):
+        if config.instance_id in router_ids:
+            errors.append("router {} is configured more than once".format(config.instance_id))
+        router_ids.add(config.instance_id)
+        for port in config.input_ports:
+            if port not in port_owners:
+                port_owners[port] = config.instance_id
+                port_configs[port] = position
+            elif port_configs[port] == position:
+                errors.append("router {} lists input port {} more than once".format(config.instance_id, port))
+            elif port_owners[port] == config.instance_id:
+                errors.append("port {} is an input port of more than one configuration of router {}".format(
+                    port, config.instance_id))
+            else:
+                errors.append("port {} is an input port of both router {} and router {}".format(
+                    port, port_owners[port], config.instance_id))
+
+    costs = {} # key=(router_id, neighbour_id), value=cost
+    for config in configs:
+        listed = set()
+        for port, cost, neighbour_id in config.neighbour_info:
+            if neighbour_id == config.instance_id:
+                errors.append("router {} is linked to itself".format(config.instance_id))
+                continue
+            owner = port_owners.get(port)
+            if owner is None:
+                errors.append("router {} sends to router {} on port {}, which no router receives on".format(
+                    config.instance_id, neighbour_id, port))
+            elif owner != neighbour_id:
+                errors.append("router {} sends to router {} on port {}, which is an input port of router {}".format(
+                    config.instance_id, neighbour_id, port, owner))
+            if neighbour_id in listed:
+                errors.append("router {} lists router {} more than once".format(config.instance_id, neighbour_id))
+            listed.add(neighbour_id)
+            costs[(config.instance_id, neighbour_id)] = cost
+
+    for (router_id, neighbour_id), cost in costs.items():
+        reverse = costs.get((neighbour_id, router_id))
+        if neighbour_id not in router_ids:
+            errors.append("router {} has a link to router {}, which is not in the network".format(
+                router_id, neighbour_id))
+        elif reverse is None:
+            errors.append("router {} has a link to router {}, but router {} has no link back".format(
+                router_id, neighbour_id, neighbour_id))
+        elif reverse != cost and router_id < neighbour_id:
+            errors.append("the link between routers {} and {} costs {} from {} but {} from {}".format(
+                router_id, neighbour_id, cost, router_id, reverse, neighbour_id))
+    return errors
+
+
+def read_topology(filename):
+    """
+    Reads a topology file and returns a list of RouterConfigs. If there are
+    any problems, prints all of them then calls sys.exit
+    """
+    configs, errors = parse_topology(read_lines_from_file(filename), filename)
+    if errors:
+        for error in errors:
+            print(error)
+        print("{} problems found in {}".format(len(errors), filename))
+        sys.exit()
+    return configs
+
+
+def load_network(configs, topology):
+    """
+    Returns the network given to a tool on its command line: the
+    RouterConfigs read from a topology file, or else a list of configuration
+    files, where any directories are replaced by the router configuration
+    files (config*.txt) in them, leaving out a topology file kept beside
+    them. Exactly one of configs (a list of paths) and topology must be
+    given; otherwise prints a message and calls sys.exit, as read_topology
+    does
+    """
+    if bool(configs) == bool(topology):
+        print("give either configuration files or a topology file")
+        sys.exit()
+    if topology:
+        return read_topology(topology)
+    filenames = []
+    for path in configs:
+        if os.path.isdir(path):
+            filenames += sorted(os.path.join(path, name) for name in os.listdir(path)
+                if name.startswith("config") and name.endswith(".txt"))
+        else:
+            filenames.append(path)
+    return filenames
+
+
+def format_topology(configs):
+    """
+    Returns the text of a topology file describing the same network as a
+    list of RouterConfigs. The configurations should have passed
+    check_configs, as each link is written once with the cost at its lower
+    numbered end
+    """
+    lines = []
+    port_owners = {port: config.instance_id for config in configs for port in config.input_ports}
+    for config in sorted(configs, key=lambda x: x.instance_id):
+        lines.append("[router {}]".format(config.instance_id))
+        lines.append("input-ports {}".format(", ".join(str(port) for port in config.input_ports)))
+        for keyword, timer in TIMER_KEYWORDS.items():
+            lines.append("{} {}".format(keyword, getattr(config, timer)))
+        lines.append("")
+
+    # The port each router receives on from each neighbour
+    receive_ports = {(port_owners.get(port), config.instance_id): port
+        for config in configs for port, _, _ in config.neighbour_info}
+    lines.append("[links]")
+    for config in sorted(configs, key=lambda x: x.instance_id):
+        for port, cost, neighbour_id in config.neighbour_info:
+            if config.instance_id < neighbour_id:
+                lines.append("{}:{} {}:{} {}".format(config.instance_id,
+                    receive_ports.get((config.instance_id, neighbour_id), ""), neighbour_id, port, cost))
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check a network described by a topology file or by configuration files")
+    parser.add_argument("files", nargs="+",
+        help="a topology file, or with --configs the configuration file of each router")
+    parser.add_argument("--configs", action="store_true",
+        help="check separate configuration files rather than a topology file")
+    parser.add_argument("--write", metavar="FILE", help="write the network to FILE as a topology file")
+    arguments = parser.parse_args()
+
+    if arguments.configs:
+        configs = [load_config(filename) for filename in arguments.files]
+        errors = check_configs(configs)
+    else:
+        configs, errors = parse_topology(read_lines_from_file(arguments.files[0]), arguments.files[0])
+    for error in errors:
+        print(error)
+    print("{} routers, {} links, {} problems".format(len(configs),
+        sum(len(config.neighbour_info) for config in configs) // 2, len(errors)))
+
+    if arguments.write and not errors:
+        with open(arguments.write, "w") as topology_file:
+            topology_file.write(format_topology(configs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Records everything a router does to a compact binary trace, so that a run
+can be replayed offline (see ripreplay). Recorded are the events which drive
+the router (its first update, each received packet and each time it processes
+its timers), every value it reads from its clock and random generator while
+handling them, the packets it sends, and snapshots of its table after every
+periodic update and when it closes.
+
+A trace is a file header (holding the name of the router's configuration
+file and the options the router was created with, as JSON) followed by
+records. Each record is a header of (kind, port, length)
+and then length bytes:
+    START   the router sent its first update
+    RECV    a packet was received, which is the payload
+    TIMER   the router processed its timers
+    CLOCK   a clock reading, a little endian double
+    RNG     a random number, a little endian double
+    SEND    a packet sent to port
+    TABLE   the table as little endian (destination, cost, next_hop) words
+    RESTORE routes restored from a snapshot when the router was created, as
+            (destination, cost, next_hop, last_response_time) records
+
+Records are written through a large buffer, so recording costs a few
+microseconds per packet and can be left on
+
+Christopher Stewart (cst141) 21069553
+Frederik Markwell (fma107) 51118501
+"""
+
+import json, struct
+
+MAGIC = b"RIPTRACE"
+VERSION = 2
+
+START, RECV, TIMER, CLOCK, RNG, SEND, TABLE, RESTORE = range(1, 9)
+KIND_NAMES = {START: "START", RECV: "RECV", TIMER: "TIMER", CLOCK: "CLOCK",
+    RNG: "RNG", SEND: "SEND", TABLE: "TABLE", RESTORE: "RESTORE"}
+
+FILE_HEADER = struct.Struct('<8sBHH') # magic, version, lengths of config filename and options
+RECORD_HEADER = struct.Struct('<BHI') # kind, port, length
+VALUE_RECORD = struct.Struct('<BHId') # a record holding one double
+VALUE_SIZE = 8
+RESTORED_ROUTE = struct.Struct('<HBHd') # destination, cost, next_hop, last_response_time
+
+# Default size of the write buffer in bytes
+BUFFER_SIZE = 1 << 16
+
+
+class TraceRecorder():
+    """
+    Appends a router's records to a trace file. The router calls the methods
+    below as it works; its clock and random generator are wrapped so that
+    every value read from them is recorded. options is a dictionary of the
+    keyword arguments the router was created with which change what it does
+    (such as stagger), so that ripreplay can create it the same way
+    """
+    def __init__(self, filename, config_filename, options=None, buffer_size=BUFFER_SIZE):
+        self.file = open(filename, "wb", buffering=buffer_size)
+        config = config_filename.encode()
+        options = json.dumps(options or {}).encode()
+        self.file.write(FILE_HEADER.pack(MAGIC, VERSION, len(config), len(options)) + config + options)
+        self.write = self.file.write
+
+    def record(self, kind, payload=b"", port=0):
+        self.write(RECORD_HEADER.pack(kind, port, len(payload)))
+        self.write(payload)
+
+    def value(self, kind, value):
+        self.write(VALUE_RECORD.pack(kind, 0, VALUE_SIZE, value))
+        return value
+
+    def started(self):
+        self.record(START)
+
+    def received(self, data):
+        self.record(RECV, data)
+
+    def timers(self):
+        self.record(TIMER)
+
+    def sent(self, packet, port):
+        self.record(SEND, packet, port)
+
+    def table(self, table):
+        self.record(TABLE, encode_table(table))
+
+    def restored(self, routes):
+        self.record(RESTORE, b"".join(RESTORED_ROUTE.pack(*route) for route in routes))
+
+    def clock(self, clock):
+        """
+        Returns a clock which records every reading of clock
+        """
+        return lambda: self.value(CLOCK, clock())
+
+    def random(self, rng):
+        return RecordingRandom(self, rng)
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+class RecordingRandom():
+    """
+    Stands in for the router's random.Random, recording each number it returns
+    """
+    def __init__(self, recorder, rng):
+        self.recorder = recorder
+        self.rng = rng
+
+    def random(self):
+        return self.recorder.value(RNG, self.rng.random())
+
+
+def encode_table(table):
+    """
+    Encodes a table (dict of destination: Row) in destination order
+    """
+    values = []
+    for dest in sorted(table):
+        row = table[dest]
+        values += (dest, row.cost, row.next_hop)
+    return struct.pack("<{}I".format(len(values)), *values)
+
+
+def decode_table(payload):
+    """
+    Returns the table encoded by encode_table as {destination: (cost, next_hop)}
+    """
+    values = struct.unpack("<{}I".format(len(payload) // 4), payload)
+    return {values[i]: (values[i + 1], values[i + 2]) for i in range(0, len(values), 3)}
+
+
+def read_trace(filename):
+    """
+    Reads a trace, returning (config_filename, options, records) where
+    records is a list of (kind, port, payload), with the values of CLOCK and
+    RNG records decoded. Raises ValueError if the file is not a trace. A
+    record cut short (by the router being killed) ends the trace
+    """
+    with open(filename, "rb") as trace_file:
+        data = trace_file.read()
+    if len(data) < FILE_HEADER.size:
+        raise ValueError("{} is not a trace".format(filename))
+    magic, version, config_length, options_length = FILE_HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("{} is not a version {} trace".format(filename, VERSION))
+    offset = FILE_HEADER.size
+    config_filename = data[offset:offset + config_length].decode()
+    offset += config_length
+    options = json.loads(data[offset:offset + options_length].decode())
+    offset += options_length
+
+    records = []
+    while offset + RECORD_HEADER.size <= len(data):
+        kind, port, length = RECORD_HEADER.unpack_from(data, offset)
+        offset += RECORD_HEADER.size
+        if offset + length > len(data):
+            break
+        payload = data[offset:offset + length]
+        offset += length
+        if kind == CLOCK or kind == RNG:
+            payload = struct.unpack("<d", payload)[0]
+        records.append((kind, port, payload))
+    return config_filename, options, records
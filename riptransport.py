@@ -0,0 +1,291 @@
+"""
+Transports which carry RIP packets between routers. Each router sends and
+receives through one transport:
+    UDPTransport    - a UDP socket bound to localhost for each input port
+    UnixTransport   - a Unix datagram socket for each input port, which avoids
+                      the IP stack when all routers run on one machine
+    MemoryTransport - hands packets straight to routers in the same process
+                      through a MemoryNetwork, without any sockets
+Any transport can add latency to, or drop, the packets it sends according to
+a LinkConditions
+
+Christopher Stewart (cst141) 21069553
+Frederik Markwell (fma107) 51118501
+"""
+
+import socket, os, sys, tempfile, heapq, itertools, random
+
+# Sets the maximum size packet that the router can receive
+MAX_PACKET_SIZE = 4096
+
+# Maximum number of packets read from one socket before the router goes back
+# to checking its timers, so that a flood of packets cannot starve them
+MAX_RECEIVE_BATCH = 256
+
+# Directory the sockets of UnixTransports are created in
+UNIX_SOCKET_DIRECTORY = os.path.join(tempfile.gettempdir(), "ripd")
+
+
+class LinkConditions():
+    """
+    The latency (in seconds) and loss (probability of dropping a packet) of
+    links, the same for all links unless set for a particular link
+    """
+    def __init__(self, latency=0, loss=0, seed=None):
+        self.latency = latency
+        self.loss = loss
+        self.random = random.Random(seed)
+
+        # key=(sender_id, receiver_id), value=(latency, loss)
+        self.links = {}
+
+    def set_link(self, sender_id, receiver_id, latency=None, loss=None):
+        """
+        Sets the latency and/or loss of packets sent from one router to another
+        """
+        old_latency, old_loss = self.links.get((sender_id, receiver_id), (self.latency, self.loss))
+        self.links[(sender_id, receiver_id)] = (
+            old_latency if latency is None else latency,
+            old_loss if loss is None else loss)
+
+    def sample(self, sender_id, receiver_id):
+        """
+        Returns the latency of a packet sent over a link, or None if it is lost
+        """
+        latency, loss = self.links.get((sender_id, receiver_id), (self.latency, self.loss))
+        if loss and self.random.random() < loss:
+            return None
+        return latency
+
+
+class Transport():
+    """
+    Base class of the transports. Applies the link conditions to packets
+    being sent, then hands them to transmit. Packets with latency wait in a
+    queue until the router processes its timers after their release time
+    """
+    def __init__(self, conditions=None):
+        self.conditions = conditions
+        self.router = None
+        self.packets_lost = 0
+
+        # Heap of (release_time, sequence_number, packet, addr_port)
+        self.delayed = []
+        self.sequence = itertools.count()
+
+    def open(self, router):
+        """
+        Starts receiving packets for all of the router's input ports
+        """
+        self.router = router
+
+    def sockets(self):
+        """
+        Returns the sockets to wait on for incoming packets
+        """
+        return []
+
+    def send(self, packet, addr_port):
+        latency = 0
+        if self.conditions:
+            receiver_id = self.router.port_neighbours.get(addr_port)
+            latency = self.conditions.sample(self.router.instance_id, receiver_id)
+            if latency is None:
+                self.packets_lost += 1
+                return
+        self.transmit(packet, addr_port, latency)
+
+    def transmit(self, packet, addr_port, latency):
+        """
+        Sends a packet after latency seconds. Socket transports queue delayed
+        packets and send them from process_delayed
+        """
+        if latency > 0:
+            release = self.router.clock() + latency
+            heapq.heappush(self.delayed, (release, next(self.sequence), packet, addr_port))
+        else:
+            self.send_now(packet, addr_port)
+
+    def send_now(self, packet, addr_port):
+        raise NotImplementedError
+
+    def next_deadline(self):
+        """
+        Returns the time the next delayed packet is due, or None
+        """
+        return self.delayed[0][0] if self.delayed else None
+
+    def process_delayed(self):
+        """
+        Sends the delayed packets whose release time has passed
+        """
+        now = self.router.clock()
+        while self.delayed and self.delayed[0][0] <= now:
+            _, _, packet, addr_port = heapq.heappop(self.delayed)
+            self.send_now(packet, addr_port)
+
+    def close(self):
+        pass
+
+
+class SocketTransport(Transport):
+    """
+    A transport with one non-blocking datagram socket bound to each input port.
+    Packets are sent from the first socket
+    """
+    family = None
+
+    def __init__(self, conditions=None):
+        super().__init__(conditions)
+        self.input_sockets = []
+        self.receive_buffer = bytearray(MAX_PACKET_SIZE)
+
+    def address(self, port):
+        raise NotImplementedError
+
+    def open(self, router):
+        """
+        Creates a socket for each input port and binds it. If a port cannot be
+        bound, prints a message and calls sys.exit
+        """
+        super().open(router)
+        for rx_port in router.input_ports:
+            try:
+                rx_socket = socket.socket(self.family, socket.SOCK_DGRAM, 0)
+                self.input_sockets.append(rx_socket)
+                rx_socket.bind(self.address(rx_port))
+                rx_socket.setblocking(False)
+            except Exception as e:
+                print("failed to create socket.", rx_port, e)
+                self.close()
+                sys.exit()
+
+    def sockets(self):
+        return self.input_sockets
+
+    def receive_all(self, input_socket):
+        """
+        Yields every packet waiting on a non-blocking socket (up to
+        MAX_RECEIVE_BATCH) as a memoryview of one buffer, which is reused for
+        the next packet
+        """
+        view = memoryview(self.receive_buffer)
+        for _ in range(MAX_RECEIVE_BATCH):
+            try:
+                size = input_socket.recv_into(self.receive_buffer)
+            except BlockingIOError:
+                return
+            yield view[:size]
+
+    def send_now(self, packet, addr_port):
+        try:
+            self.input_sockets[0].sendto(packet, self.address(addr_port))
+        except (BlockingIOError, FileNotFoundError, ConnectionRefusedError):
+            # The receiver's queue is full or it is not running. As with any
+            # lost datagram, the routes will be sent again
+            self.packets_lost += 1
+
+    def close(self):
+        for input_socket in self.input_sockets:
+            input_socket.close()
+        self.input_sockets = []
+
+
+class UDPTransport(SocketTransport):
+    """
+    UDP sockets bound to localhost
+    """
+    family = socket.AF_INET
+
+    # Local computer address
+    host = 'localhost'
+
+    def address(self, port):
+        return (self.host, port)
+
+
+class UnixTransport(SocketTransport):
+    """
+    Unix datagram sockets, named after their ports, in a shared directory
+    """
+    family = socket.AF_UNIX
+
+    def __init__(self, conditions=None, directory=UNIX_SOCKET_DIRECTORY):
+        super().__init__(conditions)
+        self.directory = directory
+
+    def address(self, port):
+        return os.path.join(self.directory, "port-{}".format(port))
+
+    def open(self, router):
+        os.makedirs(self.directory, exist_ok=True)
+        for rx_port in router.input_ports:
+            # Remove sockets left behind by a router which did not close
+            if os.path.exists(self.address(rx_port)):
+                os.unlink(self.address(rx_port))
+        super().open(router)
+
+    def close(self):
+        for input_socket in self.input_sockets:
+            try:
+                os.unlink(input_socket.getsockname())
+            except (OSError, TypeError):
+                pass
+        super().close()
+
+
+class MemoryNetwork():
+    """
+    Connects the MemoryTransports of routers in one process. A packet sent to
+    a port is passed to the receive method of the router owning that port,
+    using the scheduler's call_later (an asyncio event loop, or a Simulator)
+    """
+    def __init__(self, scheduler=None):
+        self.scheduler = scheduler
+        self.port_owners = {}
+        self.packets_sent = 0
+        self.bytes_sent = 0
+        self.packets_dropped = 0
+
+    def attach(self, router):
+        for port in router.input_ports:
+            self.port_owners[port] = router
+
+    def detach(self, router):
+        for port in router.input_ports:
+            if self.port_owners.get(port) is router:
+                del self.port_owners[port]
+
+    def deliver(self, packet, addr_port, latency):
+        """
+        Schedules delivery of a packet to the router owning addr_port. Packets
+        to ports nobody owns (such as those of stopped routers) are dropped
+        """
+        self.packets_sent += 1
+        self.bytes_sent += len(packet)
+        receiver = self.port_owners.get(addr_port)
+        if receiver is None:
+            self.packets_dropped += 1
+            return
+        self.scheduler.call_later(latency, receiver.receive, packet)
+
+
+class MemoryTransport(Transport):
+    """
+    Sends packets through a MemoryNetwork. Latency is left to the network's
+    scheduler rather than queued in the transport
+    """
+    def __init__(self, network, conditions=None):
+        super().__init__(conditions)
+        self.network = network
+
+    def open(self, router):
+        super().open(router)
+        self.network.attach(router)
+
+    def transmit(self, packet, addr_port, latency):
+        self.network.deliver(packet, addr_port, latency)
+
+    def close(self):
+        if self.router:
+            self.network.detach(self.router)